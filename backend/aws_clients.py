@@ -0,0 +1,125 @@
+"""
+Shared boto3 client registry.
+
+boto3 clients are thread-safe and each holds its own urllib3 connection pool,
+so building one per request throws away credential resolution, endpoint setup
+and warm TLS connections. get_client() hands out one client per
+(service, region, credentials, config) for the life of the process.
+
+Bedrock chat calls are blocking and can run for minutes, so they go through
+run_bedrock_call() on a dedicated executor, gated per model by
+bedrock_model_slot().
+"""
+
+import os
+import json
+import asyncio
+import functools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Connection pool per client; should cover the concurrent calls a worker makes
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_CONNECT_TIMEOUT_SECONDS = int(os.environ.get('AWS_CONNECT_TIMEOUT_SECONDS', '5'))
+# botocore's default read timeout (60s) is shorter than an extended-thinking turn
+BEDROCK_READ_TIMEOUT_SECONDS = int(os.environ.get('BEDROCK_READ_TIMEOUT_SECONDS', '300'))
+
+# Threads for blocking Bedrock chat calls (Converse, ConverseStream reads)
+BEDROCK_CONVERSE_WORKERS = int(os.environ.get('BEDROCK_CONVERSE_WORKERS', '64'))
+# In-flight chat calls per model on one worker; further calls wait for a slot
+BEDROCK_MAX_CONCURRENCY_PER_MODEL = int(os.environ.get('BEDROCK_MAX_CONCURRENCY_PER_MODEL', '16'))
+
+_clients: Dict[Tuple[str, ...], Any] = {}
+_clients_lock = threading.Lock()
+_converse_executor = None
+_model_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_client(
+    service_name: str,
+    region_name: Optional[str] = None,
+    aws_access_key_id: Optional[str] = None,
+    aws_secret_access_key: Optional[str] = None,
+    **config_overrides
+):
+    """
+    Get or create a pooled client. config_overrides are botocore Config options
+    layered over the defaults (pool size, timeouts, standard retries).
+    """
+    key = (
+        service_name,
+        region_name or "",
+        aws_access_key_id or "",
+        aws_secret_access_key or "",
+        json.dumps(config_overrides, sort_keys=True)
+    )
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            options = {
+                "max_pool_connections": AWS_MAX_POOL_CONNECTIONS,
+                "connect_timeout": AWS_CONNECT_TIMEOUT_SECONDS,
+                "retries": {"max_attempts": 3, "mode": "standard"},
+            }
+            options.update(config_overrides)
+            client = boto3.client(
+                service_name,
+                region_name=region_name,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                config=Config(**options)
+            )
+            _clients[key] = client
+            logger.info(f"Created {service_name} client for {region_name} (pool={options['max_pool_connections']})")
+    return client
+
+
+def get_bedrock_runtime(aws_config: dict):
+    """Pooled bedrock-runtime client for a chat aws_config (see get_llm_config)"""
+    return get_client(
+        'bedrock-runtime',
+        region_name=aws_config['aws_region_name'],
+        aws_access_key_id=aws_config['aws_access_key_id'],
+        aws_secret_access_key=aws_config['aws_secret_access_key'],
+        read_timeout=BEDROCK_READ_TIMEOUT_SECONDS,
+        # One connection per converse thread, so calls never queue on the pool
+        max_pool_connections=max(AWS_MAX_POOL_CONNECTIONS, BEDROCK_CONVERSE_WORKERS)
+    )
+
+
+def get_converse_executor() -> ThreadPoolExecutor:
+    """Get or create the thread pool used for blocking Bedrock chat calls"""
+    global _converse_executor
+    if _converse_executor is None:
+        _converse_executor = ThreadPoolExecutor(
+            max_workers=BEDROCK_CONVERSE_WORKERS,
+            thread_name_prefix="bedrock-converse"
+        )
+    return _converse_executor
+
+
+async def run_bedrock_call(func: Callable, *args, **kwargs):
+    """Run a blocking Bedrock client call on the converse executor, off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_converse_executor(), functools.partial(func, *args, **kwargs))
+
+
+def bedrock_model_slot(model_id: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent chat calls to one Bedrock model"""
+    slot = _model_slots.get(model_id)
+    if slot is None:
+        slot = _model_slots[model_id] = asyncio.Semaphore(BEDROCK_MAX_CONCURRENCY_PER_MODEL)
+    if slot.locked():
+        logger.info(f"All {BEDROCK_MAX_CONCURRENCY_PER_MODEL} slots for {model_id} in use; waiting")
+    return slot
@@ -0,0 +1,161 @@
+"""
+MongoDB index registry.
+
+INDEXES declares every index the backend relies on; ensure_indexes() creates
+them on startup (create_indexes is a no-op for indexes that already exist).
+HOT_QUERIES lists the queries served on hot paths. Running this module
+explains each one and exits non-zero if any is answered by a collection scan:
+
+    python db_indexes.py           # check query plans
+    python db_indexes.py --ensure  # create indexes first, then check
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# collection -> indexes
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token"),
+    ],
+    "projects": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)], name="user_id_updated_at_id"),
+    ],
+    "conversations": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)], name="user_id_updated_at_id"),
+        IndexModel(
+            [("project_id", ASCENDING), ("updated_at", DESCENDING), ("id", DESCENDING)],
+            name="project_id_updated_at_id"
+        ),
+    ],
+    "messages": [
+        IndexModel(
+            [("conversation_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="conversation_id_created_at_id"
+        ),
+    ],
+    "files": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("project_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="project_id_created_at_id"),
+        IndexModel([("project_id", ASCENDING), ("original_filename", ASCENDING)], name="project_id_original_filename"),
+    ],
+    "file_versions": [
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("file_id", ASCENDING), ("version", DESCENDING)], name="file_id_version"),
+    ],
+    "rag_chunks": [
+        IndexModel(
+            [("project_id", ASCENDING), ("file_id", ASCENDING), ("content_hash", ASCENDING)],
+            name="project_id_file_id_content_hash"
+        ),
+    ],
+    "rag_text_blocks": [
+        IndexModel(
+            [("project_id", ASCENDING), ("file_id", ASCENDING), ("content_hash", ASCENDING), ("start", ASCENDING)],
+            name="project_id_file_id_content_hash_start"
+        ),
+    ],
+}
+
+# (name, collection, filter, sort) with representative values; list endpoints
+# page on (sort key, id)
+HOT_QUERIES: List[Tuple[str, str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("session lookup", "user_sessions", {"session_token": "x"}, None),
+    ("user by id", "users", {"user_id": "x"}, None),
+    ("user by email", "users", {"email": "x"}, None),
+    ("project by id", "projects", {"id": "x"}, None),
+    ("projects for user", "projects",
+     {"$or": [{"user_id": "x"}, {"user_id": None}, {"user_id": {"$exists": False}}]}, [("updated_at", DESCENDING), ("id", DESCENDING)]),
+    ("conversation by id", "conversations", {"id": "x"}, None),
+    ("conversations for user", "conversations",
+     {"$or": [{"user_id": "x"}, {"user_id": None}, {"user_id": {"$exists": False}}]}, [("updated_at", DESCENDING), ("id", DESCENDING)]),
+    ("conversations for project", "conversations", {"project_id": "x"}, [("updated_at", DESCENDING), ("id", DESCENDING)]),
+    ("conversation messages", "messages", {"conversation_id": "x"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("file by id", "files", {"id": "x"}, None),
+    ("project files", "files", {"project_id": "x"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("file by name", "files", {"project_id": "x", "original_filename": "x"}, None),
+    ("file versions", "file_versions", {"file_id": "x"}, [("version", DESCENDING)]),
+    ("project chunks", "rag_chunks", {"project_id": "x"}, None),
+    ("file chunks", "rag_chunks", {"project_id": "x", "file_id": "x"}, None),
+    ("file version chunks", "rag_chunks", {"project_id": "x", "file_id": "x", "content_hash": "x"}, None),
+    ("text blocks", "rag_text_blocks",
+     {"project_id": "x", "file_id": "x", "content_hash": "x", "start": {"$lt": 1}, "end": {"$gt": 0}}, None),
+]
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create any missing indexes from INDEXES; failures are logged, not raised"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except Exception as e:
+            logger.error(f"Failed to ensure indexes on {collection}: {e}")
+    logger.info(f"Ensured indexes on {len(INDEXES)} collections")
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """All stage names in an explain() plan tree"""
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+async def check_query_plans(db: AsyncIOMotorDatabase) -> List[str]:
+    """Explain every hot query; returns the names of those planned as a collection scan"""
+    scans = []
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            scans.append(name)
+        logger.info(f"{name} ({collection}): {' <- '.join(stages)}")
+    return scans
+
+
+async def main(ensure: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if ensure:
+            await ensure_indexes(db)
+        scans = await check_query_plans(db)
+    finally:
+        client.close()
+
+    if scans:
+        logger.error(f"Collection scans: {', '.join(scans)}")
+        return 1
+    logger.info(f"All {len(HOT_QUERIES)} hot queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main(ensure="--ensure" in sys.argv[1:])))
@@ -6,39 +6,271 @@ Implements contextual retrieval:
 2. Embeddings via AWS Bedrock Titan (no heavy local dependencies)
 3. Embeddings stored in MongoDB for persistence
 4. Hybrid search (semantic + keyword)
+5. Process-resident per-project embedding matrices for fast search
 """
 
 import os
 import re
 import json
+import time
+import asyncio
+import random
+import sys
 import hashlib
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-import boto3
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Callable
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, ReadTimeoutError
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from bson.binary import Binary
 import numpy as np
 
+from aws_clients import get_client
+
 logger = logging.getLogger(__name__)
 
 # Chunk configuration
 CHUNK_SIZE = 400  # approximate words per chunk
 CHUNK_OVERLAP = 50  # overlapping words between chunks
 TOP_K_RESULTS = 5  # Number of chunks to retrieve
+EMBEDDING_MODEL_ID = 'amazon.titan-embed-text-v2:0'
+EMBEDDING_DIMENSIONS = 512  # Titan embedding size requested from Bedrock
+
+# Stored embeddings are packed little-endian floats in BSON binary.
+# 'float32' (default) is lossless for Titan output; 'float16' halves storage again.
+EMBEDDING_STORAGE_DTYPE = os.environ.get('RAG_EMBEDDING_STORAGE_DTYPE', 'float32')
+_STORAGE_DTYPES = {'float32': np.dtype('<f4'), 'float16': np.dtype('<f2')}
+
+# Max concurrent Bedrock embedding calls per worker process. Calls run on a
+# dedicated thread pool of this size so they never block the event loop.
+EMBEDDING_CONCURRENCY = int(os.environ.get('RAG_EMBEDDING_CONCURRENCY', '8'))
+
+# Retry policy for embedding calls (exponential backoff with jitter)
+EMBEDDING_MAX_RETRIES = int(os.environ.get('RAG_EMBEDDING_MAX_RETRIES', '4'))
+EMBEDDING_RETRY_BASE_DELAY = 0.5  # seconds, doubled on each retry
+
+# Token-bucket rate limit for embedding calls (requests/second per worker).
+# On throttling the rate is halved, then recovers additively on success.
+EMBEDDING_RATE_LIMIT = float(os.environ.get('RAG_EMBEDDING_RATE_LIMIT', '50'))
+EMBEDDING_MIN_RATE = 1.0
+EMBEDDING_RATE_RECOVERY = 0.05  # fraction of the configured rate regained per success
+
+# Bedrock error codes treated as throttling by the scheduler
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+
+# Bedrock error codes worth retrying (throttling and transient service errors)
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+}
+
+# Tokenizer used to measure retrieved context (tiktoken if installed, else a regex estimate)
+CONTEXT_TOKENIZER_ENCODING = 'cl100k_base'
+
+# Chunks diffed, embedded and written per round when indexing a document stream
+INDEX_BATCH_CHUNKS = int(os.environ.get('RAG_INDEX_BATCH_CHUNKS', '64'))
+
+# Extracted document text is stored in rag_text_blocks in pieces of at most
+# this many characters; chunks reference it by character offsets
+TEXT_BLOCK_CHARS = int(os.environ.get('RAG_TEXT_BLOCK_CHARS', '8192'))
+
+# Resident matrix cache configuration (per worker process)
+MATRIX_CACHE_MAX_BYTES = int(os.environ.get('RAG_MATRIX_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+MATRIX_CACHE_TTL_SECONDS = int(os.environ.get('RAG_MATRIX_CACHE_TTL_SECONDS', '300'))
 
-# Bedrock client (lazy initialized)
-_bedrock_client = None
+# Approximate nearest neighbour (IVF-flat) search for large projects.
+# Projects below ANN_MIN_CHUNKS always use exact search. ANN_NPROBE is the
+# recall/latency knob: more probed lists = better recall, slower queries.
+ANN_ENABLED = os.environ.get('RAG_ANN_ENABLED', 'true').lower() == 'true'
+ANN_MIN_CHUNKS = int(os.environ.get('RAG_ANN_MIN_CHUNKS', '2000'))
+ANN_NPROBE = int(os.environ.get('RAG_ANN_NPROBE', '8'))
+ANN_RETRAIN_GROWTH = 2.0  # retrain centroids once the project doubles in size
+
+# Quantized resident vectors for large projects: 'int8' (4x smaller),
+# 'binary' (32x smaller) or 'none'. Candidates are generated over the codes
+# and the best RESCORE_CANDIDATES are rescored with full-precision vectors.
+QUANTIZATION_MODE = os.environ.get('RAG_QUANTIZATION', 'int8').lower()
+QUANTIZE_MIN_CHUNKS = int(os.environ.get('RAG_QUANTIZE_MIN_CHUNKS', '5000'))
+RESCORE_CANDIDATES = int(os.environ.get('RAG_RESCORE_CANDIDATES', '200'))
+RESCORE_CACHE_VECTORS = int(os.environ.get('RAG_RESCORE_CACHE_VECTORS', '20000'))
+
+# Chunk texts kept in memory for search results; everything else is fetched per query
+CHUNK_TEXT_CACHE_ITEMS = int(os.environ.get('RAG_CHUNK_TEXT_CACHE_ITEMS', '2000'))
+
+# Query embeddings kept in memory, keyed by normalized query text
+QUERY_CACHE_ITEMS = int(os.environ.get('RAG_QUERY_CACHE_ITEMS', '1000'))
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('RAG_QUERY_CACHE_TTL_SECONDS', '3600'))
+
+# BM25 keyword scoring parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Embedding executor (lazy initialized)
+_embedding_executor = None
 
 def get_bedrock_client():
-    """Get or create Bedrock runtime client"""
-    global _bedrock_client
-    if _bedrock_client is None:
-        _bedrock_client = boto3.client(
-            'bedrock-runtime',
-            region_name=os.environ.get('AWS_REGION', 'us-east-1'),
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+    """Shared Bedrock runtime client for embeddings (boto3 clients are thread-safe)"""
+    return get_client(
+        'bedrock-runtime',
+        region_name=os.environ.get('AWS_REGION', 'us-east-1'),
+        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        # Retries are handled by embed_with_retry, not botocore
+        max_pool_connections=EMBEDDING_CONCURRENCY,
+        retries={"max_attempts": 1, "mode": "standard"}
+    )
+
+
+def get_embedding_executor() -> ThreadPoolExecutor:
+    """Get or create the bounded thread pool used for blocking Bedrock embedding calls"""
+    global _embedding_executor
+    if _embedding_executor is None:
+        _embedding_executor = ThreadPoolExecutor(
+            max_workers=EMBEDDING_CONCURRENCY,
+            thread_name_prefix="bedrock-embed"
         )
-    return _bedrock_client
+    return _embedding_executor
+
+
+# Embedding priority classes: interactive queries always go before bulk indexing
+PRIORITY_QUERY = 0
+PRIORITY_BULK = 1
+_PRIORITY_NAMES = {PRIORITY_QUERY: "query", PRIORITY_BULK: "bulk"}
+
+
+class EmbeddingScheduler:
+    """
+    Admission control for Bedrock embedding calls (event loop use only).
+    
+    A call needs a token from a bucket refilled at `rate` per second and one
+    of `max_in_flight` slots. Waiters are queued per priority class and the
+    highest class is always served first, so chat queries overtake a large
+    reindex. The rate adapts AIMD-style: halved on throttling, raised a
+    little on every success, never above the configured limit.
+    """
+    
+    def __init__(self, rate: float = EMBEDDING_RATE_LIMIT, max_in_flight: int = EMBEDDING_CONCURRENCY):
+        self.max_rate = max(rate, EMBEDDING_MIN_RATE)
+        self.rate = self.max_rate
+        self.max_in_flight = max(1, max_in_flight)
+        self.tokens = self.max_rate
+        self.in_flight = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._queues: Dict[int, deque] = {priority: deque() for priority in _PRIORITY_NAMES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits = {priority: {"count": 0, "total": 0.0, "max": 0.0} for priority in _PRIORITY_NAMES}
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_rate, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def _try_take(self) -> bool:
+        self._refill()
+        if self.in_flight < self.max_in_flight and self.tokens >= 1:
+            self.tokens -= 1
+            self.in_flight += 1
+            return True
+        return False
+    
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue and queue[0].done():
+                queue.popleft()
+            if queue:
+                return queue[0]
+        return None
+    
+    def _dispatch(self):
+        self._timer = None
+        while True:
+            waiter = self._next_waiter()
+            if waiter is None or not self._try_take():
+                break
+            for queue in self._queues.values():
+                if queue and queue[0] is waiter:
+                    queue.popleft()
+                    break
+            waiter.set_result(None)
+        # Out of tokens (not slots): wake up when the next one is due
+        if waiter is not None and self.in_flight < self.max_in_flight and self._timer is None:
+            delay = (1 - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+    
+    def _record_wait(self, priority: int, waited: float):
+        stats = self._waits[priority]
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+    
+    async def acquire(self, priority: int = PRIORITY_BULK):
+        """Wait for a token and an in-flight slot; pair with release()"""
+        if self._next_waiter() is None and self._try_take():
+            self._record_wait(priority, 0.0)
+            return
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(waiter)
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just before the cancellation landed
+                self.release()
+            raise
+        self._record_wait(priority, time.monotonic() - queued_at)
+    
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+    
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * EMBEDDING_RATE_RECOVERY)
+    
+    def on_throttled(self):
+        self.throttled += 1
+        self.rate = max(EMBEDDING_MIN_RATE, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait times per priority class, plus the current rate"""
+        classes = {}
+        for priority, name in _PRIORITY_NAMES.items():
+            waits = self._waits[priority]
+            classes[name] = {
+                "queued": sum(1 for waiter in self._queues[priority] if not waiter.done()),
+                "granted": waits["count"],
+                "avg_wait_ms": round(1000 * waits["total"] / waits["count"], 2) if waits["count"] else 0.0,
+                "max_wait_ms": round(1000 * waits["max"], 2)
+            }
+        return {
+            "rate_limit": self.max_rate,
+            "current_rate": round(self.rate, 2),
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "classes": classes
+        }
+
+
+_embedding_scheduler = EmbeddingScheduler()
+
+
+def get_embedding_scheduler_stats() -> Dict[str, Any]:
+    """Embedding scheduler metrics for this worker"""
+    return _embedding_scheduler.stats()
 
 
 def count_words(text: str) -> int:
@@ -46,123 +278,361 @@ def count_words(text: str) -> int:
     return len(text.split())
 
 
-def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+def iter_chunks(
+    segments: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    emit_text: Optional[Callable[[str], None]] = None
+) -> Iterator[Dict[str, Any]]:
     """
-    Split text into overlapping chunks of approximately chunk_size words.
-    Returns list of chunk dicts with text and metadata.
-    """
-    if not text or not text.strip():
-        return []
+    Incrementally split a stream of text segments (pages, paragraphs) into
+    overlapping chunks of approximately chunk_size words. Only the chunk
+    being built is held in memory. Segments are paragraph boundaries.
     
-    # Split by paragraphs first to maintain coherence
-    paragraphs = re.split(r'\n\s*\n', text)
+    The document is normalized to its stripped paragraphs joined by blank
+    lines. Every chunk is a contiguous span of that text, given as start/end
+    character offsets; emit_text receives the normalized text piece by piece
+    (before the chunks that cover it) so callers can store it.
     
-    chunks = []
-    current_chunk = []
+    Because chunks are spans, sentence-split chunks keep the document's own
+    whitespace between sentences and paragraphs. The list-based chunker this
+    replaced joined sentences with single spaces, so its chunk texts (and
+    chunk hashes) differ: a document indexed before that change is fully
+    re-embedded the first time it is indexed again.
+    """
+    units: List[Tuple[int, int, int]] = []  # (start, end, words) of the current chunk's paragraphs/sentences
     current_words = 0
+    chunk_index = 0
+    length = 0  # characters of normalized text produced so far
+    window = ""  # normalized text from window_start on
+    window_start = 0
+    
+    def append(piece: str):
+        nonlocal length, window
+        window += piece
+        length += len(piece)
+        if emit_text:
+            emit_text(piece)
+    
+    def make_chunk() -> Dict[str, Any]:
+        start, end = units[0][0], units[-1][1]
+        chunk_text_str = window[start - window_start:end - window_start]
+        return {
+            "text": chunk_text_str,
+            "word_count": count_words(chunk_text_str),
+            "chunk_index": chunk_index,
+            "start": start,
+            "end": end
+        }
+    
+    def keep(kept: List[Tuple[int, int, int]], next_start: int):
+        nonlocal units, current_words, window, window_start
+        units = kept
+        current_words = sum(words for _, _, words in units)
+        new_start = units[0][0] if units else next_start
+        window = window[new_start - window_start:]
+        window_start = new_start
     
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
+    for segment in segments:
+        if not segment:
             continue
+        
+        # Split by paragraphs first to maintain coherence
+        for para in re.split(r'\n\s*\n', segment):
+            para = para.strip()
+            if not para:
+                continue
             
-        para_words = count_words(para)
-        
-        # If single paragraph is too large, split by sentences
-        if para_words > chunk_size:
-            sentences = re.split(r'(?<=[.!?])\s+', para)
-            for sent in sentences:
-                sent_words = count_words(sent)
-                if current_words + sent_words > chunk_size and current_chunk:
+            if length:
+                append("\n\n")
+            para_start = length
+            append(para)
+            para_words = count_words(para)
+            
+            # If single paragraph is too large, split by sentences
+            if para_words > chunk_size:
+                position = 0
+                for sent in re.split(r'(?<=[.!?])\s+', para):
+                    position = para.find(sent, position)
+                    sent_span = (para_start + position, para_start + position + len(sent), count_words(sent))
+                    position += len(sent)
+                    if current_words + sent_span[2] > chunk_size and units:
+                        # Save current chunk
+                        yield make_chunk()
+                        chunk_index += 1
+                        # Keep overlap
+                        keep(units[-2:] if len(units) > 2 else [], sent_span[0])
+                    
+                    units.append(sent_span)
+                    current_words += sent_span[2]
+            else:
+                if current_words + para_words > chunk_size and units:
                     # Save current chunk
-                    chunk_text_str = ' '.join(current_chunk)
-                    chunks.append({
-                        "text": chunk_text_str,
-                        "word_count": count_words(chunk_text_str),
-                        "chunk_index": len(chunks)
-                    })
-                    # Keep overlap
-                    overlap_text = ' '.join(current_chunk[-2:]) if len(current_chunk) > 2 else ''
-                    current_chunk = [overlap_text] if overlap_text else []
-                    current_words = count_words(overlap_text) if overlap_text else 0
+                    yield make_chunk()
+                    chunk_index += 1
+                    # Keep some overlap
+                    last_start, last_end, _ = units[-1]
+                    keep(units[-1:] if last_end - last_start < 200 else [], para_start)
                 
-                current_chunk.append(sent)
-                current_words += sent_words
-        else:
-            if current_words + para_words > chunk_size and current_chunk:
-                # Save current chunk
-                chunk_text_str = '\n\n'.join(current_chunk)
-                chunks.append({
-                    "text": chunk_text_str,
-                    "word_count": count_words(chunk_text_str),
-                    "chunk_index": len(chunks)
-                })
-                # Keep some overlap
-                if current_chunk:
-                    overlap_text = current_chunk[-1] if len(current_chunk[-1]) < 200 else ''
-                    current_chunk = [overlap_text] if overlap_text else []
-                    current_words = count_words(overlap_text) if overlap_text else 0
-                else:
-                    current_chunk = []
-                    current_words = 0
-            
-            current_chunk.append(para)
-            current_words += para_words
+                units.append((para_start, length, para_words))
+                current_words += para_words
     
     # Don't forget the last chunk
-    if current_chunk:
-        chunk_text_str = '\n\n'.join(current_chunk)
-        chunks.append({
-            "text": chunk_text_str,
-            "word_count": count_words(chunk_text_str),
-            "chunk_index": len(chunks)
+    if units:
+        yield make_chunk()
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Split text into overlapping chunks of approximately chunk_size words.
+    Returns list of chunk dicts with text and metadata.
+    """
+    if not text or not text.strip():
+        return []
+    return list(iter_chunks([text], chunk_size, overlap))
+
+
+def invoke_embedding_model(text: str) -> List[float]:
+    """
+    Blocking call to Bedrock Titan Embeddings. Raises on failure.
+    Run this through get_embedding_executor(), never directly on the event loop.
+    """
+    client = get_bedrock_client()
+    
+    # Truncate text if too long (Titan has input limits)
+    text = text[:8000]
+    
+    response = client.invoke_model(
+        modelId=EMBEDDING_MODEL_ID,
+        contentType='application/json',
+        accept='application/json',
+        body=json.dumps({
+            "inputText": text,
+            "dimensions": EMBEDDING_DIMENSIONS,  # Smaller dimension for efficiency
+            "normalize": True
         })
+    )
     
-    return chunks
+    result = json.loads(response['body'].read())
+    return result.get('embedding', [])
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether an embedding failure is transient (throttling, timeouts, 5xx)"""
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+    return isinstance(error, (BotocoreConnectionError, ReadTimeoutError))
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """Whether Bedrock rejected a call for exceeding the request quota"""
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+async def embed_with_retry(
+    text: str,
+    max_retries: int = EMBEDDING_MAX_RETRIES,
+    priority: int = PRIORITY_BULK
+) -> List[float]:
+    """
+    Embed one text off the event loop, retrying transient errors with
+    exponential backoff. Every attempt is admitted by the embedding
+    scheduler at the given priority. Raises once retries are exhausted.
+    """
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        try:
+            await _embedding_scheduler.acquire(priority)
+            try:
+                embedding = await loop.run_in_executor(get_embedding_executor(), invoke_embedding_model, text)
+            finally:
+                _embedding_scheduler.release()
+            if not embedding:
+                raise ValueError("Bedrock returned an empty embedding")
+            _embedding_scheduler.on_success()
+            return embedding
+        except Exception as e:
+            if is_throttling_error(e):
+                _embedding_scheduler.on_throttled()
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+            attempt += 1
+            logger.warning(f"Embedding attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
 
 
 async def get_bedrock_embedding(text: str) -> List[float]:
-    """Get embedding for text using AWS Bedrock Titan Embeddings"""
+    """Get a query embedding from AWS Bedrock Titan Embeddings (off the event loop, query priority)"""
     try:
-        client = get_bedrock_client()
-        
-        # Truncate text if too long (Titan has input limits)
-        text = text[:8000]
-        
-        # Call Bedrock Titan Embeddings
-        response = client.invoke_model(
-            modelId='amazon.titan-embed-text-v2:0',
-            contentType='application/json',
-            accept='application/json',
-            body=json.dumps({
-                "inputText": text,
-                "dimensions": 512,  # Smaller dimension for efficiency
-                "normalize": True
-            })
-        )
-        
-        result = json.loads(response['body'].read())
-        return result.get('embedding', [])
-        
+        return await embed_with_retry(text, max_retries=1, priority=PRIORITY_QUERY)
     except Exception as e:
         logger.error(f"Error getting Bedrock embedding: {e}")
         return []
 
 
+async def embed_texts(
+    texts: List[str],
+    concurrency: int = EMBEDDING_CONCURRENCY
+) -> Tuple[List[List[float]], Dict[int, str]]:
+    """
+    Embed many texts, keeping up to `concurrency` Bedrock requests in flight.
+    Returns (embeddings, errors): embeddings are in input order with [] for
+    texts that failed after retries, and errors maps those indices to a message.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    embeddings: List[List[float]] = [[] for _ in texts]
+    errors: Dict[int, str] = {}
+    
+    async def embed_one(i: int, text: str):
+        async with semaphore:
+            try:
+                embeddings[i] = await embed_with_retry(text)
+            except Exception as e:
+                errors[i] = f"{type(e).__name__}: {e}"
+    
+    await asyncio.gather(*(embed_one(i, text) for i, text in enumerate(texts)))
+    return embeddings, errors
+
+
 async def get_bedrock_embeddings_batch(texts: List[str]) -> List[List[float]]:
-    """Get embeddings for multiple texts (sequential calls to Bedrock)"""
-    embeddings = []
-    for text in texts:
-        embedding = await get_bedrock_embedding(text)
-        embeddings.append(embedding)
+    """Get embeddings for multiple texts (concurrent calls to Bedrock, [] for failures)"""
+    embeddings, errors = await embed_texts(texts)
+    if errors:
+        logger.warning(f"{len(errors)} of {len(texts)} embeddings failed: {next(iter(errors.values()))}")
     return embeddings
 
 
+# Process-wide counters for the persistent embedding cache
+_embedding_cache_stats = {"hits": 0, "misses": 0}
+
+
+def embedding_cache_key(text: str) -> str:
+    """Content address of an embedding: (model id, dimensions, hash of the embedded text)"""
+    return f"{EMBEDDING_MODEL_ID}:{EMBEDDING_DIMENSIONS}:{compute_chunk_hash(text)}"
+
+
+async def embed_texts_cached(
+    db: AsyncIOMotorDatabase,
+    texts: List[str]
+) -> Tuple[List[List[float]], Dict[int, str]]:
+    """
+    Like embed_texts, but reuses vectors from the embedding_cache collection.
+    The cache is shared across files, versions and projects, so identical
+    chunk text is only ever sent to Bedrock once per model configuration.
+    """
+    keys = [embedding_cache_key(text) for text in texts]
+    cached = {}
+    if keys:
+        async for doc in db.embedding_cache.find({"_id": {"$in": list(set(keys))}}, {"embedding": 1}):
+            embedding = decode_embedding(doc.get("embedding"))
+            if embedding is not None:
+                cached[doc["_id"]] = embedding
+    
+    embeddings: List[List[float]] = [cached.get(key, []) for key in keys]
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    _embedding_cache_stats["hits"] += len(keys) - len(missing)
+    _embedding_cache_stats["misses"] += len(missing)
+    
+    errors: Dict[int, str] = {}
+    if missing:
+        fresh, fresh_errors = await embed_texts([texts[i] for i in missing])
+        writes = {}
+        for j, i in enumerate(missing):
+            if j in fresh_errors:
+                errors[i] = fresh_errors[j]
+                continue
+            embeddings[i] = fresh[j]
+            writes[keys[i]] = UpdateOne(
+                {"_id": keys[i]},
+                {"$setOnInsert": {
+                    "model_id": EMBEDDING_MODEL_ID,
+                    "dimensions": EMBEDDING_DIMENSIONS,
+                    "embedding": encode_embedding(fresh[j])
+                }},
+                upsert=True
+            )
+        if writes:
+            await db.embedding_cache.bulk_write(list(writes.values()), ordered=False)
+    
+    logger.info(f"Embedding cache: {len(keys) - len(missing)} hits, {len(missing)} misses")
+    return embeddings, errors
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the embedding cache since process start"""
+    hits = _embedding_cache_stats["hits"]
+    misses = _embedding_cache_stats["misses"]
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0
+    }
+
+
+def encode_embedding(embedding) -> Binary:
+    """Pack an embedding as little-endian float32/float16 bytes for storage"""
+    dtype = _STORAGE_DTYPES.get(EMBEDDING_STORAGE_DTYPE, _STORAGE_DTYPES['float32'])
+    return Binary(np.asarray(embedding, dtype=dtype).tobytes())
+
+
+def decode_embedding(value) -> Optional[np.ndarray]:
+    """
+    Load a stored embedding. Packed binary is read zero-copy with np.frombuffer
+    (the element size follows from the byte length); legacy BSON arrays of
+    doubles are still accepted.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        itemsize = len(value) // EMBEDDING_DIMENSIONS
+        dtype = np.dtype('<f2') if itemsize == 2 else np.dtype('<f4')
+        return np.frombuffer(value, dtype=dtype)
+    if len(value) == 0:
+        return None
+    return np.asarray(value, dtype=np.float32)
+
+
+async def migrate_embeddings_to_binary(db: AsyncIOMotorDatabase, batch_size: int = 500) -> Dict[str, int]:
+    """
+    One-shot migration of embeddings stored as BSON arrays (rag_chunks and
+    embedding_cache) to packed binary. Safe to re-run; returns documents
+    converted per collection.
+    """
+    migrated = {}
+    for collection in (db.rag_chunks, db.embedding_cache):
+        count = 0
+        batch = []
+        async for doc in collection.find({"embedding": {"$type": "array"}}, {"_id": 1, "embedding": 1}):
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": encode_embedding(doc["embedding"])}}))
+            if len(batch) >= batch_size:
+                await collection.bulk_write(batch, ordered=False)
+                count += len(batch)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+            count += len(batch)
+        migrated[collection.name] = count
+        logger.info(f"Migrated {count} embeddings in {collection.name} to binary")
+    return migrated
+
+
 def compute_content_hash(content: str) -> str:
     """Compute hash of content for deduplication"""
     return hashlib.md5(content.encode()).hexdigest()
 
 
+def contextualize_chunk(filename: str, text: str) -> str:
+    """Text embedded for a chunk: the chunk prefixed with its document name"""
+    return f"From document '{filename}':\n\n{text}"
+
+
+def compute_chunk_hash(text_with_context: str) -> str:
+    """Compute hash of a chunk's embedded text, used to diff file versions"""
+    return hashlib.sha256(text_with_context.encode('utf-8')).hexdigest()
+
+
 def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     """Compute cosine similarity between two vectors"""
     if not vec1 or not vec2:
@@ -181,29 +651,752 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return float(dot_product / (norm_a * norm_b))
 
 
-def compute_keyword_scores(query: str, chunks: List[Dict]) -> List[float]:
-    """Compute simple keyword matching scores"""
-    if not chunks:
-        return []
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens used for keyword (BM25) scoring"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def compute_term_freqs(text: str) -> Tuple[Dict[str, int], int]:
+    """Term frequencies and token count of a chunk, stored with the chunk at index time"""
+    term_freqs: Dict[str, int] = {}
+    tokens = tokenize(text)
+    for token in tokens:
+        term_freqs[token] = term_freqs.get(token, 0) + 1
+    return term_freqs, len(tokens)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array"""
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        indices = np.argpartition(-scores, k - 1)[:k]
+    else:
+        indices = np.arange(n)
+    return indices[np.argsort(-scores[indices], kind="stable")]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize matrix rows in place (zero rows are left as zeros)"""
+    if matrix.size:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+    return matrix
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF-flat) index over the rows of a ProjectMatrix.
+    Rows are clustered with spherical k-means; a query scores the centroids,
+    probes the nprobe closest lists and only those rows are scored exactly.
+    assignments is kept parallel to the matrix rows.
+    """
     
-    # Simple keyword matching (TF-IDF-like without sklearn)
-    query_words = set(query.lower().split())
-    scores = []
+    TRAIN_ITERATIONS = 8
+    TRAIN_SAMPLES_PER_LIST = 64
     
-    for chunk in chunks:
-        chunk_text = chunk.get("text", "").lower()
-        chunk_words = set(chunk_text.split())
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, trained_size: int):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.trained_size = trained_size
+    
+    @classmethod
+    def train(cls, matrix: np.ndarray, seed: int = 0) -> "IVFIndex":
+        """Cluster L2-normalized rows into ~sqrt(n) lists (CPU heavy, run off the event loop)"""
+        n = len(matrix)
+        n_lists = int(min(1024, max(16, np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, n_lists * cls.TRAIN_SAMPLES_PER_LIST)
+        sample = matrix[rng.choice(n, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=min(n_lists, sample_size), replace=False)].copy()
+        
+        for _ in range(cls.TRAIN_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=len(centroids)) == 0
+            # Re-seed empty lists from random samples
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            centroids = _normalize_rows(sums)
         
-        # Calculate overlap
-        overlap = query_words.intersection(chunk_words)
-        if not query_words:
-            scores.append(0.0)
+        return cls(centroids, cls._assign(centroids, matrix), n)
+    
+    @staticmethod
+    def _assign(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        if not len(vectors):
+            return np.zeros(0, dtype=np.int32)
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+    
+    def add(self, vectors: np.ndarray):
+        self.assignments = np.concatenate([self.assignments, self._assign(self.centroids, vectors)])
+    
+    def keep(self, keep: np.ndarray):
+        self.assignments = self.assignments[keep]
+    
+    def candidates(self, query: np.ndarray, nprobe: int = ANN_NPROBE) -> np.ndarray:
+        """Row indices in the nprobe lists closest to the (normalized) query"""
+        nprobe = min(max(1, nprobe), len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self.assignments, probe))
+
+
+# Rows flattened per step while building keyword postings
+POSTINGS_BUILD_BLOCK_ROWS = 1000
+
+
+class InvertedIndex:
+    """
+    BM25 inverted index over the rows of a ProjectMatrix: term -> postings
+    (row indices and term frequencies) plus per-row document lengths.
+    Built from the term_freqs/token_count stored on each chunk, and kept
+    parallel to the matrix rows like IVFIndex.
+    """
+    
+    def __init__(self):
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+    
+    def add(self, term_freqs: List[Dict[str, int]], lengths: List[int]):
+        """Append rows (in matrix order) with their term frequencies"""
+        new_postings = self._build_postings(term_freqs, len(self.doc_lengths))
+        if not self.postings:
+            self.postings = new_postings
+        else:
+            for term, (rows, tfs) in new_postings.items():
+                if term in self.postings:
+                    old_rows, old_tfs = self.postings[term]
+                    rows = np.concatenate([old_rows, rows])
+                    tfs = np.concatenate([old_tfs, tfs])
+                self.postings[term] = (rows, tfs)
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.asarray(lengths, dtype=np.float32)])
+    
+    @staticmethod
+    def _build_postings(term_freqs: List[Dict[str, int]], offset: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Postings for consecutive rows starting at offset, built in bulk: every
+        (term, row, tf) goes into flat arrays, one sort groups them by term
+        and the result is split into per-term views. Rows are flattened in
+        blocks so no single C call holds the GIL for long (loads run in a
+        worker thread next to the event loop).
+        """
+        vocab: Dict[str, int] = {}
+        term_id_blocks, tf_blocks = [], []
+        for block_start in range(0, len(term_freqs), POSTINGS_BUILD_BLOCK_ROWS):
+            block = term_freqs[block_start:block_start + POSTINGS_BUILD_BLOCK_ROWS]
+            terms = list(chain.from_iterable(block))
+            for term in dict.fromkeys(terms):
+                vocab.setdefault(term, len(vocab))
+            term_id_blocks.append(np.fromiter(map(vocab.__getitem__, terms), dtype=np.int64, count=len(terms)))
+            tf_blocks.append(np.fromiter(chain.from_iterable(map(dict.values, block)), dtype=np.float32, count=len(terms)))
+        if not vocab:
+            return {}
+        term_ids = np.concatenate(term_id_blocks)
+        tfs = np.concatenate(tf_blocks)
+        counts = np.fromiter(map(len, term_freqs), dtype=np.int64, count=len(term_freqs))
+        end = offset + len(term_freqs)
+        rows = np.repeat(np.arange(offset, end, dtype=np.int64), counts)
+        # (term, row) pairs are unique, so sorting the combined key keeps rows ascending per term
+        order = np.argsort(term_ids * end + rows)
+        bounds = np.cumsum(np.bincount(term_ids, minlength=len(vocab)))[:-1]
+        rows_by_term = np.split(rows[order].astype(np.int32), bounds)
+        tfs_by_term = np.split(tfs[order], bounds)
+        return dict(zip(vocab, zip(rows_by_term, tfs_by_term)))
+    
+    def keep(self, keep: np.ndarray):
+        """Drop rows where keep is False and renumber the remaining postings (in bulk, like add)"""
+        if self.postings:
+            terms = list(self.postings)
+            postings = list(self.postings.values())
+            counts = np.fromiter((len(rows) for rows, _ in postings), dtype=np.int64, count=len(postings))
+            rows = np.concatenate([rows for rows, _ in postings])
+            tfs = np.concatenate([tfs for _, tfs in postings])
+            term_ids = np.repeat(np.arange(len(terms)), counts)
+            kept = keep[rows]
+            new_rows = np.cumsum(keep, dtype=np.int64) - 1
+            counts = np.bincount(term_ids[kept], minlength=len(terms))
+            bounds = np.cumsum(counts)[:-1]
+            rows_by_term = np.split(new_rows[rows[kept]].astype(np.int32), bounds)
+            tfs_by_term = np.split(tfs[kept], bounds)
+            self.postings = {
+                term: posting
+                for term, count, posting in zip(terms, counts, zip(rows_by_term, tfs_by_term))
+                if count
+            }
+        self.doc_lengths = self.doc_lengths[keep]
+    
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every row for the query, touching only the postings of
+        the query terms. Scaled by the query's maximum attainable score so
+        values fall in [0, 1) for blending with cosine similarity.
+        """
+        n = len(self.doc_lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        avg_length = float(self.doc_lengths.mean()) or 1.0
+        upper_bound = 0.0
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            idf = np.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[rows] / avg_length)
+            scores[rows] += idf * tfs * (BM25_K1 + 1.0) / (tfs + norm)
+            upper_bound += idf * (BM25_K1 + 1.0)
+        if upper_bound > 0:
+            scores /= upper_bound
+        return scores
+
+
+class LRUCache:
+    """
+    Small bounded LRU mapping for per-process caches (event loop use only).
+    With ttl_seconds > 0, entries also expire that long after being stored.
+    With max_weight > 0, the total weigh(value) of stored entries is bounded too.
+    """
+    
+    def __init__(
+        self,
+        max_items: int,
+        ttl_seconds: float = 0,
+        max_weight: int = 0,
+        weigh: Optional[Callable[[Any], int]] = None
+    ):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self._items: "OrderedDict[Any, Tuple[Any, float, int]]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is None:
+            return default
+        value, stored_at, _ = item
+        if self.ttl_seconds > 0 and time.monotonic() - stored_at >= self.ttl_seconds:
+            self.pop(key)
+            return default
+        self._items.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        self.pop(key)
+        weight = self.weigh(value) if self.weigh else 0
+        if self.max_weight and weight > self.max_weight:
+            return  # Would evict everything and still not fit
+        self._items[key] = (value, time.monotonic(), weight)
+        self.weight += weight
+        while len(self._items) > self.max_items or (self.max_weight and self.weight > self.max_weight):
+            _, (_, _, evicted) = self._items.popitem(last=False)
+            self.weight -= evicted
+    
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        self.weight -= item[2]
+        return item[0]
+
+
+# Popcount of every byte value, for Hamming distance over packed bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class QuantizedVectors:
+    """
+    Compact codes for L2-normalized rows, used for candidate generation.
+    int8: per-row scale, score = (codes @ query) * scale.
+    binary: sign bits packed 8 per byte, score = 1 - 2 * hamming / dims
+    (an estimate of cosine similarity from the angle between sign vectors).
+    """
+    
+    def __init__(self, mode: str, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.mode = mode
+        self.codes = codes
+        self.scales = scales
+    
+    @classmethod
+    def encode(cls, mode: str, matrix: np.ndarray) -> "QuantizedVectors":
+        if mode == "binary":
+            return cls(mode, np.packbits(matrix > 0, axis=1))
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(matrix / scales[:, None]).astype(np.int8)
+        return cls(mode, codes, scales.astype(np.float32))
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+    
+    def append(self, matrix: np.ndarray):
+        other = self.encode(self.mode, matrix)
+        self.codes = np.concatenate([self.codes, other.codes])
+        if self.scales is not None:
+            self.scales = np.concatenate([self.scales, other.scales])
+    
+    def keep(self, keep: np.ndarray):
+        self.codes = np.ascontiguousarray(self.codes[keep])
+        if self.scales is not None:
+            self.scales = self.scales[keep]
+    
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine similarity of a normalized query against rows (all by default)"""
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0)
+            hamming = _POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
+            return (1.0 - 2.0 * hamming / EMBEDDING_DIMENSIONS).astype(np.float32)
+        scales = self.scales if rows is None else self.scales[rows]
+        return (codes.astype(np.float32) @ query) * scales
+    
+    def dequantize(self) -> np.ndarray:
+        """Approximate float rows (used to train the IVF index)"""
+        if self.mode == "binary":
+            signs = np.unpackbits(self.codes, axis=1)[:, :EMBEDDING_DIMENSIONS].astype(np.float32) * 2.0 - 1.0
+            return signs / np.sqrt(EMBEDDING_DIMENSIONS)
+        return _normalize_rows(self.codes.astype(np.float32) * self.scales[:, None])
+
+
+# Per-term cost of a postings entry beyond its arrays' data: the (rows, tfs)
+# tuple and two ndarray headers
+_POSTING_OVERHEAD_BYTES = sys.getsizeof((None, None)) + 2 * sys.getsizeof(np.zeros(0))
+# Rows sampled when estimating a ProjectMatrix's per-row Python overhead
+ROW_SIZE_SAMPLE = 64
+
+# IVF training runs in progress (held so the tasks are not garbage collected)
+_ann_training_tasks = set()
+
+
+class ProjectMatrix:
+    """
+    Resident copy of one project's chunks.
+    Embeddings live in a single contiguous float32 matrix (rows L2-normalized,
+    so cosine similarity is a plain dot product) with parallel id and
+    metadata arrays in the same row order. Large projects swap the matrix
+    for QuantizedVectors; their scores are approximate and must be rescored.
+    Chunk text is not kept here; search fetches it for the winners only.
+    """
+    
+    def __init__(self, ids: List[Any], chunks: List[Dict[str, Any]], matrix: np.ndarray, keywords: InvertedIndex):
+        self.ids = ids
+        self.chunks = chunks
+        self.matrix: Optional[np.ndarray] = matrix
+        self.quantized: Optional[QuantizedVectors] = None
+        self.keywords = keywords
+        self.built_at = time.monotonic()
+        self.ann: Optional[IVFIndex] = None
+        self.version = 0  # bumped on every mutation
+        self._ann_task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def _split_docs(docs: List[Dict]) -> Tuple[List[Any], List[Dict[str, Any]], np.ndarray, List[Dict[str, int]], List[int]]:
+        ids = []
+        chunks = []
+        term_freqs = []
+        lengths = []
+        matrix = np.zeros((len(docs), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        for row, doc in enumerate(docs):
+            ids.append(doc.get("_id"))
+            chunks.append({
+                "file_id": doc.get("file_id"),
+                "filename": doc.get("filename", ""),
+                "chunk_index": doc.get("chunk_index", 0)
+            })
+            embedding = decode_embedding(doc.get("embedding"))
+            if embedding is not None and len(embedding) == EMBEDDING_DIMENSIONS:
+                matrix[row] = embedding
+            if "term_freqs" in doc:
+                term_freqs.append(doc["term_freqs"])
+                lengths.append(doc.get("token_count", 0))
+            else:
+                # Chunks indexed before BM25 support
+                freqs, length = compute_term_freqs(doc.get("text", ""))
+                term_freqs.append(freqs)
+                lengths.append(length)
+        return ids, chunks, _normalize_rows(matrix), term_freqs, lengths
+    
+    @classmethod
+    def from_docs(cls, docs: List[Dict]) -> "ProjectMatrix":
+        ids, chunks, matrix, term_freqs, lengths = cls._split_docs(docs)
+        keywords = InvertedIndex()
+        keywords.add(term_freqs, lengths)
+        entry = cls(ids, chunks, matrix, keywords)
+        entry._maybe_quantize()
+        return entry
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate resident size: vectors, IVF index, keyword postings (with
+        their per-term Python objects) and the id list and per-chunk dicts,
+        whose per-row cost is estimated from a sample of rows.
+        """
+        vectors = self.quantized.nbytes if self.quantized is not None else self.matrix.nbytes
+        if self.ann is not None:
+            vectors += self.ann.centroids.nbytes + self.ann.assignments.nbytes
+        postings = sys.getsizeof(self.keywords.postings) + self.keywords.doc_lengths.nbytes + sum(
+            sys.getsizeof(term) + _POSTING_OVERHEAD_BYTES + rows.nbytes + tfs.nbytes
+            for term, (rows, tfs) in self.keywords.postings.items()
+        )
+        return vectors + postings + len(self) * self._row_bytes()
+    
+    def _row_bytes(self) -> int:
+        """Estimated bytes per row held in Python objects (list slots, id, chunk dict and its values)"""
+        if not self.ids:
+            return 0
+        sample = range(0, len(self.ids), max(1, len(self.ids) // ROW_SIZE_SAMPLE))
+        total = 0
+        for row in sample:
+            chunk = self.chunks[row]
+            total += 2 * 8 + sys.getsizeof(self.ids[row]) + sys.getsizeof(chunk)
+            total += sum(sys.getsizeof(value) for value in chunk.values())
+        return total // len(sample)
+    
+    @property
+    def is_quantized(self) -> bool:
+        return self.quantized is not None
+    
+    def _maybe_quantize(self):
+        """Replace the float32 matrix with compact codes once the project is large enough"""
+        if self.quantized is None and QUANTIZATION_MODE in ("int8", "binary") and len(self) >= QUANTIZE_MIN_CHUNKS:
+            self.quantized = QuantizedVectors.encode(QUANTIZATION_MODE, self.matrix)
+            self.matrix = None
+            logger.info(f"Quantized resident matrix ({QUANTIZATION_MODE}): {len(self)} chunks, {self.quantized.nbytes} bytes")
+    
+    def add(self, docs: List[Dict]):
+        """Append freshly indexed chunk documents"""
+        if not docs:
+            return
+        ids, chunks, matrix, term_freqs, lengths = self._split_docs(docs)
+        self.ids.extend(ids)
+        self.chunks.extend(chunks)
+        if self.quantized is not None:
+            self.quantized.append(matrix)
         else:
-            # Simple Jaccard-like score
-            score = len(overlap) / len(query_words)
-            scores.append(score)
+            self.matrix = np.vstack([self.matrix, matrix])
+        self.keywords.add(term_freqs, lengths)
+        if self.ann is not None:
+            self.ann.add(matrix)
+        self.version += 1
+        self._maybe_quantize()
+    
+    def _drop_rows(self, keep: np.ndarray) -> int:
+        removed = int(len(keep) - keep.sum())
+        if removed:
+            self.ids = [i for i, k in zip(self.ids, keep) if k]
+            self.chunks = [c for c, k in zip(self.chunks, keep) if k]
+            if self.quantized is not None:
+                self.quantized.keep(keep)
+            else:
+                self.matrix = np.ascontiguousarray(self.matrix[keep])
+            self.keywords.keep(keep)
+            if self.ann is not None:
+                self.ann.keep(keep)
+            self.version += 1
+        return removed
+    
+    def remove_file(self, file_id: str) -> int:
+        """Drop every row belonging to file_id, returns number of rows removed"""
+        return self._drop_rows(np.array([c["file_id"] != file_id for c in self.chunks], dtype=bool))
+    
+    def remove_ids(self, ids: List[Any]) -> int:
+        """Drop rows by chunk id, returns number of rows removed"""
+        ids = set(ids)
+        return self._drop_rows(np.array([i not in ids for i in self.ids], dtype=bool))
+    
+    def renumber(self, chunk_indexes: Dict[Any, int]):
+        """Update chunk_index for rows whose position in their file changed"""
+        for row, chunk_id in enumerate(self.ids):
+            if chunk_id in chunk_indexes:
+                self.chunks[row]["chunk_index"] = chunk_indexes[chunk_id]
+    
+    def query_vector(self, query_embedding: List[float]) -> Optional[np.ndarray]:
+        """Normalized float32 query, or None if it can't be scored against this matrix"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != EMBEDDING_DIMENSIONS:
+            return None
+        return query / norm
+    
+    def similarities(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of a normalized query against every row (one mat-vec
+        product), or only against `rows` with zeros elsewhere. Approximate
+        when the entry is quantized.
+        """
+        if self.quantized is not None:
+            if rows is None:
+                return self.quantized.scores(query)
+            scores = np.zeros(len(self), dtype=np.float32)
+            scores[rows] = self.quantized.scores(query, rows)
+            return scores
+        if rows is None:
+            return self.matrix @ query
+        scores = np.zeros(len(self), dtype=np.float32)
+        scores[rows] = self.matrix[rows] @ query
+        return scores
+    
+    @property
+    def uses_ann(self) -> bool:
+        return ANN_ENABLED and len(self) >= ANN_MIN_CHUNKS
+    
+    def train_ann_in_background(self):
+        """
+        Start training (or retraining after large growth) the IVF index in a
+        background task. Searches meanwhile use exact scoring, or the previous
+        index, which keeps assigning new rows to its existing lists.
+        """
+        if not self.uses_ann or self._ann_task is not None:
+            return
+        if self.ann is not None and len(self) <= self.ann.trained_size * ANN_RETRAIN_GROWTH:
+            return
+        self._ann_task = asyncio.create_task(self._train_ann())
+        _ann_training_tasks.add(self._ann_task)
+        self._ann_task.add_done_callback(_ann_training_tasks.discard)
+    
+    async def _train_ann(self):
+        try:
+            version = self.version
+            vectors = self.quantized.dequantize() if self.quantized is not None else self.matrix
+            ann = await asyncio.to_thread(IVFIndex.train, vectors)
+            # Discard if rows changed while training; the next search retrains
+            if version == self.version:
+                self.ann = ann
+                logger.info(f"Trained IVF index: {len(ann.centroids)} lists over {ann.trained_size} chunks")
+        except Exception as e:
+            logger.error(f"IVF index training failed: {e}")
+        finally:
+            self._ann_task = None
     
-    return scores
+    def ann_candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Candidate rows from the IVF index, or None when exact search should be used"""
+        if not self.uses_ann or self.ann is None:
+            return None
+        return self.ann.candidates(query)
+
+
+class ProjectMatrixCache:
+    """
+    LRU cache of ProjectMatrix objects across projects, bounded by total bytes.
+    
+    Entries are built from MongoDB on first use and then kept current by
+    RAGIndex.index_document/remove_document. Writes that land while an entry
+    is loading are recorded and replayed onto it (replays are idempotent, as
+    the load may already have seen them). The cache is per process, so
+    entries also expire after ttl_seconds to pick up writes made by other
+    workers.
+    """
+    
+    def __init__(self, max_bytes: int = MATRIX_CACHE_MAX_BYTES, ttl_seconds: int = MATRIX_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, ProjectMatrix]" = OrderedDict()
+        # project -> writes seen while its entry is loading
+        self._pending: Dict[str, List[Tuple[str, Any]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    def _fresh(self, entry: ProjectMatrix) -> bool:
+        return self.ttl_seconds <= 0 or time.monotonic() - entry.built_at < self.ttl_seconds
+    
+    async def get(self, collection, project_id: str) -> ProjectMatrix:
+        """Return the resident matrix for a project, loading it from MongoDB if needed"""
+        entry = self._entries.get(project_id)
+        if entry is not None and self._fresh(entry):
+            self._entries.move_to_end(project_id)
+            return entry
+        
+        lock = self._locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(project_id)
+            if entry is not None and self._fresh(entry):
+                self._entries.move_to_end(project_id)
+                return entry
+            
+            # Rebuild, recording writes made meanwhile to replay onto the new entry
+            pending = self._pending[project_id] = []
+            try:
+                docs = await collection.find(
+                    {"project_id": project_id},
+                    {"_id": 1, "file_id": 1, "filename": 1, "chunk_index": 1,
+                     "embedding": 1, "term_freqs": 1, "token_count": 1}
+                ).to_list(None)
+                # Chunks indexed before BM25 support need their text to build postings
+                legacy = {doc["_id"]: doc for doc in docs if "term_freqs" not in doc}
+                if legacy:
+                    async for doc in collection.find({"_id": {"$in": list(legacy)}}, {"_id": 1, "text": 1}):
+                        legacy[doc["_id"]]["text"] = doc.get("text", "")
+                # Decoding, postings and quantization take seconds for large projects
+                entry = await asyncio.to_thread(ProjectMatrix.from_docs, docs)
+            finally:
+                self._pending.pop(project_id, None)
+            
+            if not self._replay(entry, pending):
+                # Invalidated while loading: serve this load once, reload next time
+                return entry
+            self._entries[project_id] = entry
+            self._entries.move_to_end(project_id)
+            self._evict(keep=project_id)
+            logger.info(f"Loaded resident matrix for project {project_id}: {len(entry)} chunks, {entry.nbytes} bytes")
+            return entry
+    
+    def _touch(self, project_id: str, *write) -> Optional[ProjectMatrix]:
+        """Record a write for an in-progress load of the project; returns its resident entry"""
+        pending = self._pending.get(project_id)
+        if pending is not None:
+            pending.append(write)
+        return self._entries.get(project_id)
+    
+    @staticmethod
+    def _replay(entry: ProjectMatrix, pending: List[Tuple[str, Any]]) -> bool:
+        """Apply writes recorded during a load; False if one of them invalidated the project"""
+        for kind, *args in pending:
+            if kind == "invalidate":
+                return False
+            if kind == "remove_file":
+                entry.remove_file(*args)
+                continue
+            added, removed_ids, renumbered = args
+            if removed_ids:
+                entry.remove_ids(removed_ids)
+            if renumbered:
+                entry.renumber(renumbered)
+            loaded = set(entry.ids)
+            entry.add([doc for doc in added if doc["_id"] not in loaded])
+        return True
+    
+    def update_chunks(
+        self,
+        project_id: str,
+        added: List[Dict],
+        removed_ids: List[Any],
+        renumbered: Dict[Any, int]
+    ):
+        """Apply an incremental reindex (inserted, deleted and renumbered chunks) to a resident entry"""
+        entry = self._touch(project_id, "update", added, removed_ids, renumbered)
+        if entry is not None:
+            if removed_ids:
+                entry.remove_ids(removed_ids)
+            if renumbered:
+                entry.renumber(renumbered)
+            entry.add(added)
+            self._evict(keep=project_id)
+    
+    def remove_file(self, project_id: str, file_id: str):
+        """Drop a file's rows from a resident entry"""
+        entry = self._touch(project_id, "remove_file", file_id)
+        if entry is not None:
+            entry.remove_file(file_id)
+    
+    def train_ann(self, project_id: str, entry: ProjectMatrix):
+        """Train a resident entry's IVF index in the background; entries that were not kept are skipped"""
+        if self._entries.get(project_id) is entry:
+            entry.train_ann_in_background()
+    
+    def invalidate(self, project_id: str):
+        """Forget a project's entry entirely"""
+        self._touch(project_id, "invalidate")
+        self._entries.pop(project_id, None)
+    
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Drop least recently used entries until the total fits max_bytes,
+        evicting keep last. An entry bigger than the whole budget is dropped
+        by itself (it is rebuilt from MongoDB for each search instead).
+        """
+        sizes = {project_id: entry.nbytes for project_id, entry in self._entries.items()}
+        if keep in sizes and sizes[keep] > self.max_bytes:
+            self._entries.pop(keep)
+            logger.warning(
+                f"Resident matrix for project {keep} ({sizes.pop(keep)} bytes) exceeds "
+                f"RAG_MATRIX_CACHE_MAX_BYTES ({self.max_bytes}); not caching it"
+            )
+        total = sum(sizes.values())
+        while total > self.max_bytes and self._entries:
+            project_id = next(iter(self._entries))
+            if project_id == keep and len(self._entries) > 1:
+                self._entries.move_to_end(project_id)
+                project_id = next(iter(self._entries))
+            self._entries.pop(project_id)
+            total -= sizes[project_id]
+            logger.info(f"Evicted resident matrix for project {project_id}")
+
+
+_matrix_cache = ProjectMatrixCache()
+
+# Full-precision vectors fetched for rescoring quantized candidates, by chunk id
+_rescore_vectors = LRUCache(RESCORE_CACHE_VECTORS)
+
+# Text and location of recently returned chunks, by chunk id. A reused chunk keeps
+# its text but moves to a new content_hash and offsets, so reindexing pops it.
+_chunk_texts = LRUCache(CHUNK_TEXT_CACHE_ITEMS)
+
+# Query embeddings by normalized text, plus the Bedrock calls currently in flight
+_query_embeddings = LRUCache(QUERY_CACHE_ITEMS, QUERY_CACHE_TTL_SECONDS)
+_query_embeddings_inflight: Dict[str, "asyncio.Task"] = {}
+_query_embedding_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: NFC-normalized with whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+async def _embed_query(key: str) -> Optional[np.ndarray]:
+    try:
+        embedding = await get_bedrock_embedding(key)
+        if not embedding:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        _query_embeddings.put(key, vector)
+        return vector
+    finally:
+        _query_embeddings_inflight.pop(key, None)
+
+
+async def get_query_embedding(query: str) -> Optional[np.ndarray]:
+    """
+    Embedding for a search query, or None on failure.
+    Served from an in-process LRU/TTL cache; concurrent callers asking for
+    the same text share a single Bedrock call.
+    """
+    key = normalize_query(query)
+    vector = _query_embeddings.get(key)
+    if vector is not None:
+        _query_embedding_stats["hits"] += 1
+        return vector
+    
+    task = _query_embeddings_inflight.get(key)
+    if task is None:
+        _query_embedding_stats["misses"] += 1
+        task = asyncio.ensure_future(_embed_query(key))
+        _query_embeddings_inflight[key] = task
+    else:
+        _query_embedding_stats["coalesced"] += 1
+    # Shielded so one cancelled request doesn't cancel the call for the others
+    return await asyncio.shield(task)
+
+
+def get_query_embedding_stats() -> Dict[str, Any]:
+    """Hit/miss/coalesced counters for the query embedding cache since process start"""
+    return {**_query_embedding_stats, "size": len(_query_embeddings), "in_flight": len(_query_embeddings_inflight)}
 
 
 class RAGIndex:
@@ -216,6 +1409,10 @@ class RAGIndex:
         self.db = db
         self.project_id = project_id
         self.collection = db.rag_chunks
+        # Extracted text of each indexed file version, referenced by chunk offsets
+        self.text_blocks = db.rag_text_blocks
+        # Chunks whose embedding failed during the last index_document call
+        self.failed_chunks: List[Dict[str, Any]] = []
         
     async def index_document(
         self, 
@@ -226,78 +1423,244 @@ class RAGIndex:
     ) -> int:
         """
         Index a document by chunking and creating embeddings.
-        Returns number of chunks created.
+        Returns number of chunks embedded. Chunks whose embedding failed are
+        still stored (without an embedding, so keyword search can find them),
+        listed in self.failed_chunks, and retried on the next call.
         """
         if not content or not content.strip():
+            self.failed_chunks = []
             return 0
+        return await self.index_document_stream(file_id, filename, [content], compute_content_hash(content))
+    
+    async def index_document_stream(
+        self,
+        file_id: str,
+        filename: str,
+        segments: Iterable[str],
+        content_hash: str
+    ) -> int:
+        """
+        Index a document of any size from a stream of text segments (pages or
+        paragraphs). The segment iterator is consumed off the event loop and
+        chunks are diffed, embedded and stored INDEX_BATCH_CHUNKS at a time,
+        so memory stays bounded. content_hash identifies the source content;
+        if it is already indexed only previously failed chunks are retried.
+        Same return value and failure handling as index_document: the number
+        of the file's chunks that have an embedding, also on a hash match.
+        """
+        self.failed_chunks = []
         
-        # Check if already indexed (by content hash)
-        content_hash = compute_content_hash(content)
-        existing = await self.collection.find_one({
-            "project_id": self.project_id,
-            "file_id": file_id,
-            "content_hash": content_hash
-        })
+        version = {"project_id": self.project_id, "file_id": file_id, "content_hash": content_hash}
+        
+        # Check if already indexed (by content hash of a completely stored version)
+        existing = await self.text_blocks.find_one({**version, "complete": True}, {"_id": 1})
         
         if existing:
-            logger.info(f"Document {filename} already indexed (hash match)")
-            return 0
+            retried = await self._retry_failed_chunks(file_id)
+            if not retried:
+                logger.info(f"Document {filename} already indexed (hash match)")
+            return await self.collection.count_documents(
+                {"project_id": self.project_id, "file_id": file_id, "embedding": {"$ne": None}}
+            )
         
-        # Remove old chunks for this file
-        await self.collection.delete_many({
-            "project_id": self.project_id,
-            "file_id": file_id
-        })
+        # Leftovers of an interrupted run for this same version
+        await self.text_blocks.delete_many(version)
         
-        # Create contextual prefix for chunks
-        doc_context = f"From document '{filename}':"
+        # Diff against the chunks already stored for this file (previous version)
+        stored_by_hash: Dict[str, List[Dict]] = {}
+        failed_ids = []
+        async for doc in self.collection.find(
+            {"project_id": self.project_id, "file_id": file_id},
+            {"_id": 1, "chunk_hash": 1, "chunk_index": 1, "embedding_error": 1}
+        ):
+            if doc.get("embedding_error"):
+                failed_ids.append(doc["_id"])  # Re-embedded rather than reused
+                continue
+            if doc.get("chunk_hash"):
+                stored_by_hash.setdefault(doc["chunk_hash"], []).append(doc)
+        # Chunks stored before chunk hashes were recorded
+        async for doc in self.collection.find(
+            {"project_id": self.project_id, "file_id": file_id, "chunk_hash": {"$exists": False},
+             "embedding_error": {"$exists": False}},
+            {"_id": 1, "chunk_index": 1, "text_with_context": 1}
+        ):
+            stored_by_hash.setdefault(compute_chunk_hash(doc.get("text_with_context", "")), []).append(doc)
         
-        # Chunk the document
-        chunks = chunk_text(content)
+        pieces: List[str] = []
+        chunks = iter_chunks(segments, emit_text=pieces.append)
+        text_length = 0
+        total = reused = embedded = 0
+        while True:
+            batch = await asyncio.to_thread(lambda: list(islice(chunks, INDEX_BATCH_CHUNKS)))
+            # Store the text behind this batch before any chunk points into it
+            text = "".join(pieces)
+            pieces.clear()
+            if text:
+                await self.text_blocks.insert_many([
+                    {**version, "start": text_length + i, "end": text_length + i + len(text[i:i + TEXT_BLOCK_CHARS]),
+                     "text": text[i:i + TEXT_BLOCK_CHARS]}
+                    for i in range(0, len(text), TEXT_BLOCK_CHARS)
+                ])
+                text_length += len(text)
+            if not batch:
+                break
+            batch_reused, batch_embedded = await self._index_chunk_batch(
+                file_id, filename, content_hash, batch, stored_by_hash
+            )
+            total += len(batch)
+            reused += batch_reused
+            embedded += batch_embedded
         
-        if not chunks:
-            return 0
+        vanished_ids = [doc["_id"] for docs in stored_by_hash.values() for doc in docs] + failed_ids
+        if vanished_ids:
+            await self.collection.delete_many({"_id": {"$in": vanished_ids}})
+            _matrix_cache.update_chunks(self.project_id, added=[], removed_ids=vanished_ids, renumbered={})
+        
+        # Every remaining chunk now points into this version's text
+        await self.text_blocks.update_many(version, {"$set": {"complete": True}})
+        await self.text_blocks.delete_many({
+            "project_id": self.project_id, "file_id": file_id, "content_hash": {"$ne": content_hash}
+        })
+        
+        logger.info(f"Indexed {filename}: {total} chunks, {reused} unchanged, {embedded} new, {len(vanished_ids)} removed")
+        
+        if self.failed_chunks:
+            logger.warning(f"Embedding failed for {len(self.failed_chunks)} of {total} chunks of {filename}; stored for retry")
         
-        logger.info(f"Indexing {len(chunks)} chunks for {filename}")
+        return reused + embedded
+    
+    async def _index_chunk_batch(
+        self,
+        file_id: str,
+        filename: str,
+        content_hash: str,
+        chunks: List[Dict[str, Any]],
+        stored_by_hash: Dict[str, List[Dict]]
+    ) -> Tuple[int, int]:
+        """
+        Store one batch of a document's chunks, reusing stored chunks with the
+        same hash (consumed from stored_by_hash). Returns (reused, embedded).
+        """
+        # Create contextual prefix for chunks
+        chunk_texts_with_context = [contextualize_chunk(filename, chunk["text"]) for chunk in chunks]
+        chunk_hashes = [compute_chunk_hash(text) for text in chunk_texts_with_context]
         
-        # Create embeddings for each chunk
-        chunk_texts_with_context = [
-            f"{doc_context}\n\n{chunk['text']}" for chunk in chunks
-        ]
+        updates = []
+        renumbered = {}
+        new_positions = []
+        for j, chunk in enumerate(chunks):
+            i = chunk["chunk_index"]
+            if stored_by_hash.get(chunk_hashes[j]):
+                doc = stored_by_hash[chunk_hashes[j]].pop()
+                updates.append(UpdateOne(
+                    {"_id": doc["_id"]},
+                    {
+                        "$set": {"chunk_index": i, "content_hash": content_hash, "chunk_hash": chunk_hashes[j],
+                                 "start": chunk["start"], "end": chunk["end"]},
+                        # Stored before offset-based chunks
+                        "$unset": {"text": "", "text_with_context": ""}
+                    }
+                ))
+                if doc.get("chunk_index") != i:
+                    renumbered[doc["_id"]] = i
+                _chunk_texts.pop(doc["_id"])
+            else:
+                new_positions.append(j)
         
-        embeddings = await get_bedrock_embeddings_batch(chunk_texts_with_context)
+        # Create embeddings for the new chunks only
+        embeddings, errors = await embed_texts_cached(
+            self.db, [chunk_texts_with_context[j] for j in new_positions]
+        )
         
-        # Store chunks with embeddings in MongoDB
+        # Store new chunks with embeddings in MongoDB
         docs_to_insert = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            if embedding:  # Only store if embedding was successful
-                docs_to_insert.append({
-                    "project_id": self.project_id,
-                    "file_id": file_id,
-                    "filename": filename,
-                    "content_hash": content_hash,
-                    "chunk_index": i,
-                    "text": chunk["text"],
-                    "text_with_context": chunk_texts_with_context[i],
-                    "word_count": chunk["word_count"],
-                    "embedding": embedding  # Stored in MongoDB
-                })
+        for k, j in enumerate(new_positions):
+            chunk = chunks[j]
+            term_freqs, token_count = compute_term_freqs(chunk["text"])
+            doc = {
+                "project_id": self.project_id,
+                "file_id": file_id,
+                "filename": filename,
+                "content_hash": content_hash,
+                "chunk_hash": chunk_hashes[j],
+                "chunk_index": chunk["chunk_index"],
+                "start": chunk["start"],
+                "end": chunk["end"],
+                "word_count": chunk["word_count"],
+                "term_freqs": term_freqs,
+                "token_count": token_count,
+                "embedding": None if k in errors else encode_embedding(embeddings[k])
+            }
+            if k in errors:
+                doc["embedding_error"] = errors[k]
+                self.failed_chunks.append({"chunk_index": chunk["chunk_index"], "error": errors[k]})
+            docs_to_insert.append(doc)
         
+        if updates:
+            await self.collection.bulk_write(updates, ordered=False)
         if docs_to_insert:
             await self.collection.insert_many(docs_to_insert)
-            logger.info(f"Indexed {len(docs_to_insert)} chunks for {filename} in MongoDB")
         
-        return len(docs_to_insert)
+        _matrix_cache.update_chunks(
+            self.project_id,
+            added=docs_to_insert,
+            removed_ids=[],
+            renumbered=renumbered
+        )
+        return len(updates), len(docs_to_insert) - len(errors)
+    
+    async def _retry_failed_chunks(self, file_id: str) -> int:
+        """Re-embed stored chunks of a file whose embedding previously failed"""
+        failed = await self.collection.find(
+            {"project_id": self.project_id, "file_id": file_id, "embedding": None},
+            {"_id": 1, "chunk_index": 1, "filename": 1, "file_id": 1, "content_hash": 1,
+             "start": 1, "end": 1, "text": 1, "text_with_context": 1}
+        ).to_list(None)
+        if not failed:
+            return 0
+        
+        texts = await self._load_texts(failed)
+        embeddings, errors = await embed_texts_cached(self.db, [
+            doc.get("text_with_context") or contextualize_chunk(doc.get("filename", ""), texts.get(doc["_id"], ""))
+            for doc in failed
+        ])
+        
+        retried = 0
+        for i, (doc, embedding) in enumerate(zip(failed, embeddings)):
+            if i in errors:
+                await self.collection.update_one({"_id": doc["_id"]}, {"$set": {"embedding_error": errors[i]}})
+                self.failed_chunks.append({"chunk_index": doc["chunk_index"], "error": errors[i]})
+                continue
+            await self.collection.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"embedding": encode_embedding(embedding)}, "$unset": {"embedding_error": ""}}
+            )
+            retried += 1
+        
+        if retried:
+            _matrix_cache.invalidate(self.project_id)
+        logger.info(f"Retried {len(failed)} failed chunks for file {file_id}: {retried} embedded")
+        return retried
     
     async def remove_document(self, file_id: str):
-        """Remove all chunks for a document"""
+        """Remove all chunks (and stored text) for a document"""
         result = await self.collection.delete_many({
             "project_id": self.project_id,
             "file_id": file_id
         })
+        await self.text_blocks.delete_many({"project_id": self.project_id, "file_id": file_id})
+        _matrix_cache.remove_file(self.project_id, file_id)
         logger.info(f"Removed {result.deleted_count} chunks for file {file_id}")
         return result.deleted_count
     
+    async def remove_project(self):
+        """Remove all chunks and stored text for the project"""
+        result = await self.collection.delete_many({"project_id": self.project_id})
+        await self.text_blocks.delete_many({"project_id": self.project_id})
+        _matrix_cache.invalidate(self.project_id)
+        logger.info(f"Removed {result.deleted_count} chunks for project {self.project_id}")
+        return result.deleted_count
+    
     async def search(
         self, 
         query: str, 
@@ -307,103 +1670,313 @@ class RAGIndex:
         """
         Search for relevant chunks using hybrid search.
         Combines semantic similarity with keyword matching.
+        Scores against the project's resident embedding matrix (no MongoDB
+        round trip once the matrix is loaded).
         """
-        # Get all chunks for this project
-        chunks = await self.collection.find(
-            {"project_id": self.project_id},
-            {"_id": 0}
-        ).to_list(1000)
+        matrix = await _matrix_cache.get(self.collection, self.project_id)
+        chunks = matrix.chunks
         
         if not chunks:
             logger.debug(f"No chunks found for project {self.project_id}")
             return []
         
         # Get query embedding
-        query_embedding = await get_bedrock_embedding(query)
+        query_embedding = await get_query_embedding(query)
         
-        if not query_embedding:
+        if query_embedding is None:
             # Fallback to keyword-only search
             logger.warning("Failed to get query embedding, falling back to keyword search")
-            return self._keyword_search(query, chunks, top_k)
-        
-        # Semantic search
-        semantic_scores = []
-        for chunk in chunks:
-            if chunk.get("embedding"):
-                similarity = cosine_similarity(query_embedding, chunk["embedding"])
-                semantic_scores.append((chunk, similarity))
-            else:
-                semantic_scores.append((chunk, 0.0))
+            return await self._keyword_search(query, matrix, top_k)
         
-        # Keyword search scores
-        keyword_scores = compute_keyword_scores(query, chunks)
+        query_vector = matrix.query_vector(query_embedding)
+        if query_vector is None:
+            logger.warning("Query embedding does not match index dimensions, falling back to keyword search")
+            return await self._keyword_search(query, matrix, top_k)
         
-        # Combine scores (weighted hybrid)
-        combined_scores = []
-        for i, (chunk, sem_score) in enumerate(semantic_scores):
-            kw_score = keyword_scores[i] if i < len(keyword_scores) else 0.0
-            # Weight: 70% semantic, 30% keyword
-            combined = 0.7 * sem_score + 0.3 * kw_score
-            combined_scores.append((chunk, combined, sem_score, kw_score))
+        # Keyword search scores (BM25 over the resident inverted index)
+        keyword_scores = matrix.keywords.scores(query)
         
-        # Sort by combined score
-        combined_scores.sort(key=lambda x: x[1], reverse=True)
+        # Semantic search: exact (one matrix-vector product over all chunks) for
+        # small projects; for large ones, IVF candidates plus any keyword hits
+        # once the index has been trained in the background
+        _matrix_cache.train_ann(self.project_id, matrix)
+        candidates = matrix.ann_candidates(query_vector)
+        if candidates is not None:
+            candidates = np.union1d(candidates, np.flatnonzero(keyword_scores > 0))
+        semantic_scores = matrix.similarities(query_vector, candidates)
         
-        # Return top-k with scores
-        results = []
-        for chunk, combined, sem, kw in combined_scores[:top_k]:
-            results.append({
-                "text": chunk["text"],
-                "filename": chunk["filename"],
-                "chunk_index": chunk["chunk_index"],
-                "score": float(combined),
-                "semantic_score": float(sem),
-                "keyword_score": float(kw)
-            })
+        # Combine scores (weighted hybrid) - 70% semantic, 30% keyword
+        combined_scores = 0.7 * semantic_scores + 0.3 * keyword_scores
+        
+        if matrix.is_quantized:
+            # Two-stage: rescore the best approximate candidates at full precision
+            # and rank only those
+            shortlist = top_k_indices(combined_scores, max(RESCORE_CANDIDATES, top_k))
+            semantic_scores[shortlist] = await self._full_precision_scores(matrix, query_vector, shortlist)
+            combined_scores[shortlist] = 0.7 * semantic_scores[shortlist] + 0.3 * keyword_scores[shortlist]
+            winners = shortlist[top_k_indices(combined_scores[shortlist], top_k)]
+        else:
+            winners = top_k_indices(combined_scores, top_k)
+        
+        results = await self._build_results(matrix, winners, combined_scores, semantic_scores, keyword_scores)
         
         logger.info(f"Search returned {len(results)} results for query: {query[:50]}...")
         return results
     
-    def _keyword_search(
-        self, 
-        query: str, 
-        chunks: List[Dict], 
-        top_k: int
-    ) -> List[Dict[str, Any]]:
-        """Fallback keyword-only search"""
-        scores = compute_keyword_scores(query, chunks)
+    async def _fetch_passages(self, ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Text and location (content_hash, start, end) of the given chunks, from
+        the text cache or one $in query. Offsets are None for chunks stored
+        before offset-based chunks.
+        """
+        passages = {}
+        missing = []
+        for chunk_id in ids:
+            passage = _chunk_texts.get(chunk_id)
+            if passage is None:
+                missing.append(chunk_id)
+            else:
+                passages[chunk_id] = passage
+        if missing:
+            docs = await self.collection.find(
+                {"_id": {"$in": missing}},
+                {"_id": 1, "file_id": 1, "content_hash": 1, "start": 1, "end": 1, "text": 1}
+            ).to_list(None)
+            texts = await self._load_texts(docs)
+            for doc in docs:
+                passage = {
+                    "text": texts[doc["_id"]],
+                    "content_hash": doc.get("content_hash"),
+                    "start": doc.get("start"),
+                    "end": doc.get("end")
+                }
+                passages[doc["_id"]] = passage
+                _chunk_texts.put(doc["_id"], passage)
+        return passages
+    
+    async def _load_texts(self, docs: List[Dict]) -> Dict[Any, str]:
+        """Resolve chunk docs to their text, slicing offset-based chunks out of rag_text_blocks in one query"""
+        texts = {}
+        spans = []
+        for doc in docs:
+            if "start" in doc:
+                spans.append(doc)
+            else:
+                # Stored before offset-based chunks
+                texts[doc["_id"]] = doc.get("text", "")
+        if not spans:
+            return texts
         
-        scored_chunks = list(zip(chunks, scores))
-        scored_chunks.sort(key=lambda x: x[1], reverse=True)
+        blocks: Dict[Tuple[str, str], List[Dict]] = {}
+        async for block in self.text_blocks.find(
+            {"$or": [
+                {"project_id": self.project_id, "file_id": doc["file_id"], "content_hash": doc["content_hash"],
+                 "start": {"$lt": doc["end"]}, "end": {"$gt": doc["start"]}}
+                for doc in spans
+            ]},
+            {"_id": 0, "file_id": 1, "content_hash": 1, "start": 1, "end": 1, "text": 1}
+        ):
+            blocks.setdefault((block["file_id"], block["content_hash"]), []).append(block)
         
+        for doc in spans:
+            parts = [
+                (block["start"], block["text"][max(0, doc["start"] - block["start"]):doc["end"] - block["start"]])
+                for block in blocks.get((doc["file_id"], doc["content_hash"]), [])
+                if block["start"] < doc["end"] and block["end"] > doc["start"]
+            ]
+            texts[doc["_id"]] = "".join(text for _, text in sorted(parts, key=lambda part: part[0]))
+        return texts
+    
+    async def _build_results(
+        self,
+        matrix: ProjectMatrix,
+        rows: np.ndarray,
+        combined_scores: np.ndarray,
+        semantic_scores: np.ndarray,
+        keyword_scores: np.ndarray
+    ) -> List[Dict[str, Any]]:
+        """Result dicts for the winning rows only"""
+        passages = await self._fetch_passages([matrix.ids[i] for i in rows])
         results = []
-        for chunk, score in scored_chunks[:top_k]:
+        for i in rows:
+            chunk = matrix.chunks[i]
+            passage = passages.get(matrix.ids[i])
+            if passage is None:
+                # Deleted since the resident entry was built
+                continue
             results.append({
-                "text": chunk["text"],
+                "text": passage["text"],
                 "filename": chunk["filename"],
+                "file_id": chunk["file_id"],
                 "chunk_index": chunk["chunk_index"],
-                "score": float(score),
-                "semantic_score": 0.0,
-                "keyword_score": float(score)
+                "content_hash": passage["content_hash"],
+                "start": passage["start"],
+                "end": passage["end"],
+                "score": float(combined_scores[i]),
+                "semantic_score": float(semantic_scores[i]),
+                "keyword_score": float(keyword_scores[i])
             })
-        
         return results
     
+    async def _full_precision_scores(
+        self,
+        matrix: ProjectMatrix,
+        query: np.ndarray,
+        rows: np.ndarray
+    ) -> np.ndarray:
+        """Exact cosine similarity for rows of a quantized entry, loading vectors lazily"""
+        ids = [matrix.ids[row] for row in rows]
+        missing = [chunk_id for chunk_id in ids if _rescore_vectors.get(chunk_id) is None]
+        if missing:
+            async for doc in self.collection.find({"_id": {"$in": missing}}, {"_id": 1, "embedding": 1}):
+                embedding = decode_embedding(doc.get("embedding"))
+                if embedding is not None and len(embedding) == EMBEDDING_DIMENSIONS:
+                    vector = embedding.astype(np.float32)
+                    norm = np.linalg.norm(vector)
+                    _rescore_vectors.put(doc["_id"], vector / norm if norm else vector)
+        
+        vectors = np.zeros((len(ids), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        for i, chunk_id in enumerate(ids):
+            vector = _rescore_vectors.get(chunk_id)
+            if vector is not None:
+                vectors[i] = vector
+        return vectors @ query
+    
+    async def _keyword_search(
+        self, 
+        query: str, 
+        matrix: ProjectMatrix, 
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """Fallback keyword-only search"""
+        scores = matrix.keywords.scores(query)
+        winners = top_k_indices(scores, top_k)
+        return await self._build_results(matrix, winners, scores, np.zeros_like(scores), scores)
+    
     async def get_stats(self) -> Dict[str, Any]:
         """Get index statistics"""
         total_chunks = await self.collection.count_documents({"project_id": self.project_id})
+        failed_chunks = await self.collection.count_documents({"project_id": self.project_id, "embedding": None})
         
         # Get unique files
         files = await self.collection.distinct("file_id", {"project_id": self.project_id})
         
         return {
             "total_chunks": total_chunks,
+            "failed_chunks": failed_chunks,
             "indexed_files": len(files),
             "project_id": self.project_id,
-            "embedding_provider": "bedrock-titan"
+            "embedding_provider": "bedrock-titan",
+            "embedding_cache": get_embedding_cache_stats(),
+            "query_embedding_cache": get_query_embedding_stats(),
+            "embedding_scheduler": get_embedding_scheduler_stats()
         }
 
 
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+# Word and punctuation runs; close to BPE token counts for English prose
+TOKEN_ESTIMATE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def get_tokenizer():
+    """
+    tiktoken encoding for counting context tokens, or None if unavailable.
+    Blocking: the first call may download the BPE file, so async code goes
+    through load_tokenizer().
+    """
+    global _tokenizer, _tokenizer_loaded
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                import tiktoken
+                _tokenizer = tiktoken.get_encoding(CONTEXT_TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.info(f"tiktoken unavailable ({e}); estimating context tokens with a regex")
+            _tokenizer_loaded = True
+    return _tokenizer
+
+
+async def load_tokenizer():
+    """Load the tokenizer off the event loop (a no-op once loaded)"""
+    if not _tokenizer_loaded:
+        await asyncio.to_thread(get_tokenizer)
+
+
+def count_tokens(text: str) -> int:
+    """Fast local token count for prompt budgeting; estimates until load_tokenizer() has run"""
+    tokenizer = _tokenizer
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, disallowed_special=()))
+    return max(len(TOKEN_ESTIMATE_PATTERN.findall(text)), len(text) // 4)
+
+
+def merge_passages(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge search results that overlap or sit next to each other in the same
+    file version into single passages (text appears once, best score kept).
+    Results without offsets are passed through unchanged.
+    """
+    groups: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+    passages = []
+    for result in results:
+        if result.get("start") is None:
+            passages.append(dict(result))
+        else:
+            groups.setdefault((result["file_id"], result["content_hash"]), []).append(result)
+    
+    for group in groups.values():
+        group.sort(key=lambda r: r["start"])
+        current = None
+        for result in group:
+            if current is None:
+                current = {**result, "last_chunk_index": result["chunk_index"]}
+                continue
+            if result["start"] <= current["end"]:
+                current["text"] += result["text"][current["end"] - result["start"]:]
+            elif result["chunk_index"] == current["last_chunk_index"] + 1:
+                # Only separator whitespace lies between consecutive chunks
+                current["text"] += ("\n\n" if result["start"] - current["end"] > 1 else " ") + result["text"]
+            else:
+                passages.append(current)
+                current = {**result, "last_chunk_index": result["chunk_index"]}
+                continue
+            current["end"] = max(current["end"], result["end"])
+            current["last_chunk_index"] = max(current["last_chunk_index"], result["chunk_index"])
+            current["score"] = max(current["score"], result["score"])
+        passages.append(current)
+    return passages
+
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+def format_passage(passage: Dict[str, Any]) -> str:
+    return f"[From: {passage['filename']}]\n{passage['text']}"
+
+
+def pack_context(results: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    """
+    Choose passages for the prompt. Results are added best score first,
+    each costing only the tokens it adds once merged with overlapping or
+    adjacent results already chosen; results that would overflow max_tokens
+    are skipped rather than ending the fill. Returned best score first.
+    """
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    chosen = []
+    packed = []
+    for result in sorted(results, key=lambda r: r["score"], reverse=True):
+        candidate = merge_passages(chosen + [result])
+        for passage in candidate:
+            passage["tokens"] = count_tokens(format_passage(passage))
+        if sum(p["tokens"] for p in candidate) + separator_tokens * (len(candidate) - 1) <= max_tokens:
+            chosen.append(result)
+            packed = candidate
+    return sorted(packed, key=lambda p: p["score"], reverse=True)
+
+
 async def retrieve_context_for_query(
     db: AsyncIOMotorDatabase,
     project_id: str,
@@ -422,27 +1995,13 @@ async def retrieve_context_for_query(
     if not results:
         return "", []
     
-    # Build context string, respecting approximate token limit
-    # (rough estimate: 1 token ≈ 4 characters)
-    context_parts = []
-    sources = []
-    total_chars = 0
-    max_chars = max_tokens * 4
-    
-    for result in results:
-        chunk_chars = len(result["text"])
-        if total_chars + chunk_chars > max_chars:
-            break
-        
-        context_parts.append(f"[From: {result['filename']}]\n{result['text']}")
-        sources.append({
-            "filename": result["filename"],
-            "score": result["score"]
-        })
-        total_chars += chunk_chars
-    
-    context = "\n\n---\n\n".join(context_parts)
+    # Pack merged passages into the token budget
+    await load_tokenizer()
+    packed = pack_context(results, max_tokens)
+    context = CONTEXT_SEPARATOR.join(format_passage(passage) for passage in packed)
+    sources = [{"filename": passage["filename"], "score": passage["score"]} for passage in packed]
+    total_tokens = sum(passage["tokens"] for passage in packed)
     
-    logger.info(f"Retrieved {len(sources)} context chunks ({total_chars} chars) for query")
+    logger.info(f"Retrieved {len(sources)} context passages from {len(results)} chunks ({total_tokens} tokens) for query")
     return context, sources
     
@@ -3,18 +3,21 @@ from fastapi.responses import StreamingResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple
 import uuid
 from datetime import datetime, timezone, timedelta
 import aiofiles
 import json
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 import asyncio
-from rag import RAGIndex, retrieve_context_for_query
+from rag import RAGIndex, retrieve_context_for_query, migrate_embeddings_to_binary, LRUCache, normalize_query, load_tokenizer
+from db_indexes import ensure_indexes
+from aws_clients import get_bedrock_runtime, run_bedrock_call, bedrock_model_slot
 import boto3
 from tavily import TavilyClient
 from PIL import Image as PILImage
@@ -48,6 +51,16 @@ api_router = APIRouter(prefix="/api")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# The event loop only keeps weak references to tasks; hold background work here until it finishes
+_background_tasks = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start a task that is not tied to the request that created it"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 # Tavily client for web search (optional)
 tavily_client = None
 TAVILY_API_KEY = os.environ.get('TAVILY_API_KEY')
@@ -55,6 +68,15 @@ if TAVILY_API_KEY:
     tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
     logger.info("Tavily web search enabled")
 
+# Tool calls from one model turn that may run at the same time (per request)
+BEDROCK_TOOL_CONCURRENCY = int(os.environ.get('BEDROCK_TOOL_CONCURRENCY', '4'))
+
+# KB tool results (get_kb_file, search_kb) reused across tool rounds and turns
+TOOL_CACHE_ITEMS = int(os.environ.get('TOOL_CACHE_ITEMS', '256'))
+TOOL_CACHE_MAX_CHARS = int(os.environ.get('TOOL_CACHE_MAX_CHARS', '50000000'))
+TOOL_CACHE_TTL_SECONDS = int(os.environ.get('TOOL_CACHE_TTL_SECONDS', '1800'))
+_tool_results = LRUCache(TOOL_CACHE_ITEMS, TOOL_CACHE_TTL_SECONDS, max_weight=TOOL_CACHE_MAX_CHARS, weigh=len)
+
 # ============== MODELS ==============
 
 class ProjectBase(BaseModel):
@@ -110,6 +132,7 @@ class FileMetadata(BaseModel):
     mime_type: str
     storage_path: str
     indexed: bool = False
+    index_status: Optional[str] = None  # pending, indexing, indexed or failed; None if not indexable
     content_preview: Optional[str] = None
     version: int = 1  # Current version number
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
@@ -173,6 +196,7 @@ class ChatRequest(BaseModel):
     extended_thinking: bool = False
     thinking_budget: int = 10000  # Default thinking budget tokens
     web_search: bool = False
+    stream: bool = False  # Respond with server-sent events instead of one JSON body
 
 class StorageConfig(BaseModel):
     provider: str  # 'local' or 's3'
@@ -288,6 +312,52 @@ def get_storage_provider() -> StorageProvider:
 
 storage = get_storage_provider()
 
+# ============== PAGINATION ==============
+
+# List endpoints return one page; the cursor for the next page (if any) is
+# sent in this response header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict[str, Any], sort_key: str) -> str:
+    """Opaque keyset cursor: the (sort key, id) of the last item on a page"""
+    raw = json.dumps([doc.get(sort_key), doc["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return value, last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate(
+    collection,
+    query: Dict[str, Any],
+    sort_key: str,
+    direction: int,
+    limit: int,
+    cursor: Optional[str],
+    response: Response
+) -> List[Dict[str, Any]]:
+    """
+    Keyset pagination on (sort_key, id). Returns at most `limit` docs and sets
+    the next-page cursor header when more remain.
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        op = "$lt" if direction < 0 else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_key: {op: value}},
+            {sort_key: value, "id": {op: last_id}}
+        ]}]}
+    docs = await collection.find(query, {"_id": 0}).sort(
+        [(sort_key, direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1], sort_key)
+    return docs
+
 # ============== AUTH HELPERS ==============
 
 def hash_password(password: str) -> str:
@@ -623,8 +693,8 @@ def get_file_type(filename: str) -> str:
 
 async def extract_text_content(file_content: bytes, filename: str, mime_type: str) -> str:
     """
-    Extract text content from files for RAG INDEXING (not chat attachments).
-    This is intentionally limited to create manageable chunks for vector search.
+    Extract a short text preview (content_preview) for the UI.
+    RAG indexing reads the full document via iter_document_text instead.
     For full document content in chat, see the /chat/with-files endpoint.
     """
     try:
@@ -652,6 +722,103 @@ async def extract_text_content(file_content: bytes, filename: str, mime_type: st
         logger.error(f"Error extracting text: {e}")
         return ""
 
+RAG_INDEXABLE_MIME_TYPES = {
+    'text/plain',
+    'text/markdown',
+    'application/pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+def iter_document_text(file_content: bytes, mime_type: str):
+    """
+    Yield the full text of a document for RAG INDEXING, one paragraph (text,
+    DOCX) or page (PDF) at a time, so documents of any length can be chunked
+    without building the whole text in memory. Blocking; run off the event loop.
+    """
+    import io
+    if mime_type == 'text/plain' or mime_type == 'text/markdown':
+        paragraph = []
+        for line in io.TextIOWrapper(io.BytesIO(file_content), encoding='utf-8', errors='ignore'):
+            if line.strip():
+                paragraph.append(line)
+            elif paragraph:
+                yield "".join(paragraph)
+                paragraph = []
+        if paragraph:
+            yield "".join(paragraph)
+    
+    elif mime_type == 'application/pdf':
+        from PyPDF2 import PdfReader
+        reader = PdfReader(io.BytesIO(file_content))
+        for page in reader.pages:
+            yield page.extract_text() or ""
+    
+    elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        from docx import Document
+        doc = Document(io.BytesIO(file_content))
+        for p in doc.paragraphs:
+            yield p.text
+
+async def index_file_content(rag_index: RAGIndex, file_id: str, filename: str, file_content: bytes, mime_type: str) -> int:
+    """Stream a stored file's full text into the RAG index; returns chunks indexed"""
+    if mime_type not in RAG_INDEXABLE_MIME_TYPES:
+        return 0
+    return await rag_index.index_document_stream(
+        file_id=file_id,
+        filename=filename,
+        segments=iter_document_text(file_content, mime_type),
+        content_hash=hashlib.md5(file_content).hexdigest()
+    )
+
+# Serializes indexing runs for the same file on this worker
+_file_index_locks: Dict[str, asyncio.Lock] = {}
+
+async def index_file_version(
+    project_id: str,
+    file_id: str,
+    version: int,
+    filename: str,
+    mime_type: str,
+    content: Optional[bytes] = None,
+    storage_path: Optional[str] = None,
+    force: bool = False
+):
+    """
+    Index one version of a file, tracking progress in its index_status.
+    Runs in the background after upload, restore or reindex; skipped once a
+    newer version of the file has been stored. Reads the file from storage
+    when content is not given; force drops the existing chunks first.
+    """
+    lock = _file_index_locks.setdefault(file_id, asyncio.Lock())
+    async with lock:
+        current = {"id": file_id, "version": version}
+        if not await db.files.find_one(current, {"_id": 0, "id": 1}):
+            return
+        await db.files.update_one(current, {"$set": {"index_status": "indexing"}})
+        try:
+            if content is None:
+                content = await storage.get_file(storage_path)
+            rag_index = RAGIndex(db, project_id)
+            if force:
+                await rag_index.remove_document(file_id)
+            # Incremental: only changed chunks are re-embedded
+            chunks_indexed = await index_file_content(rag_index, file_id, filename, content, mime_type)
+            update = {
+                "index_status": "indexed",
+                "indexed": chunks_indexed > 0,
+                "chunks_count": chunks_indexed,
+                "failed_chunks": len(rag_index.failed_chunks)
+            }
+            logger.info(f"RAG indexed {chunks_indexed} chunks for {filename} v{version}")
+        except Exception as e:
+            logger.error(f"RAG indexing failed for {filename} v{version}: {e}")
+            update = {"index_status": "failed"}
+        result = await db.files.update_one(current, {"$set": update})
+        if result.matched_count == 0 and not await db.files.find_one({"id": file_id}, {"_id": 0, "id": 1}):
+            # The file was deleted while it was being indexed
+            await RAGIndex(db, project_id).remove_document(file_id)
+    await bump_kb_version(project_id)
+
 # ============== PROJECT ROUTES ==============
 
 @api_router.get("/")
@@ -671,6 +838,9 @@ async def create_project(project: ProjectCreate, request: Request):
 @api_router.get("/projects", response_model=List[Project])
 async def get_projects(
     request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
     starred_only: bool = Query(False),
     archived: Optional[bool] = Query(None)
@@ -689,13 +859,7 @@ async def get_projects(
     if archived is not None:
         query["archived"] = archived
     
-    projects = await db.projects.find(query, {"_id": 0}).sort("updated_at", -1).to_list(100)
-    
-    # Get file counts
-    for p in projects:
-        count = await db.files.count_documents({"project_id": p["id"]})
-        p["file_count"] = count
-    
+    projects = await paginate(db.projects, query, "updated_at", -1, limit, cursor, response)
     return projects
 
 @api_router.get("/projects/{project_id}", response_model=Project)
@@ -709,8 +873,6 @@ async def get_project(project_id: str, request: Request):
     if user and project.get("user_id") and project["user_id"] != user.user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    count = await db.files.count_documents({"project_id": project_id})
-    project["file_count"] = count
     return project
 
 @api_router.put("/projects/{project_id}", response_model=Project)
@@ -731,8 +893,6 @@ async def update_project(project_id: str, update: ProjectUpdate, request: Reques
     await db.projects.update_one({"id": project_id}, {"$set": update_data})
     
     project = await db.projects.find_one({"id": project_id}, {"_id": 0})
-    count = await db.files.count_documents({"project_id": project_id})
-    project["file_count"] = count
     return project
 
 @api_router.put("/projects/{project_id}/star")
@@ -768,6 +928,9 @@ async def delete_project(project_id: str, request: Request):
         await storage.delete_file(f["storage_path"])
     await db.files.delete_many({"project_id": project_id})
     
+    # Delete RAG chunks and the extracted text they point into
+    await RAGIndex(db, project_id).remove_project()
+    
     # Delete conversations and messages
     convos = await db.conversations.find({"project_id": project_id}, {"_id": 0}).to_list(1000)
     for c in convos:
@@ -833,31 +996,19 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
             "content_preview": content_preview,
             "version": new_version,
             "updated_at": datetime.now(timezone.utc).isoformat(),
-            "indexed": False
+            "indexed": False,
+            "index_status": "pending" if mime_type in RAG_INDEXABLE_MIME_TYPES else None
         }
         
         await db.files.update_one({"id": existing_file["id"]}, {"$set": update_data})
         
-        # Re-index for RAG
-        if content_preview:
-            try:
-                api_key = os.environ.get('EMERGENT_LLM_KEY', '')
-                rag_index = RAGIndex(db, project_id)
-                await rag_index.remove_document(existing_file["id"])
-                chunks_indexed = await rag_index.index_document(
-                    file_id=existing_file["id"],
-                    filename=file.filename,
-                    content=content_preview,
-                    api_key=api_key
-                )
-                if chunks_indexed > 0:
-                    await db.files.update_one(
-                        {"id": existing_file["id"]},
-                        {"$set": {"indexed": True, "chunks_count": chunks_indexed}}
-                    )
-                    logger.info(f"RAG re-indexed {chunks_indexed} chunks for {file.filename} v{new_version}")
-            except Exception as e:
-                logger.error(f"RAG indexing failed for {file.filename}: {e}")
+        # Re-index for RAG after responding; poll /files/{id}/index-status for progress
+        if mime_type in RAG_INDEXABLE_MIME_TYPES:
+            run_in_background(index_file_version(
+                project_id, existing_file["id"], new_version, file.filename, mime_type, content=content
+            ))
+        
+        await bump_kb_version(project_id)
         
         # Return updated file metadata
         updated_file = await db.files.find_one({"id": existing_file["id"]}, {"_id": 0})
@@ -879,44 +1030,37 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
         mime_type=mime_type,
         storage_path=storage_path,
         indexed=False,
+        index_status="pending" if mime_type in RAG_INDEXABLE_MIME_TYPES else None,
         content_preview=content_preview,
         version=1
     )
     
     await db.files.insert_one(file_meta.model_dump())
     
-    # RAG indexing
-    if content_preview:
-        try:
-            api_key = os.environ.get('EMERGENT_LLM_KEY', '')
-            rag_index = RAGIndex(db, project_id)
-            chunks_indexed = await rag_index.index_document(
-                file_id=file_meta.id,
-                filename=file.filename,
-                content=content_preview,
-                api_key=api_key
-            )
-            if chunks_indexed > 0:
-                await db.files.update_one(
-                    {"id": file_meta.id},
-                    {"$set": {"indexed": True, "chunks_count": chunks_indexed}}
-                )
-                file_meta.indexed = True
-                logger.info(f"RAG indexed {chunks_indexed} chunks for {file.filename}")
-        except Exception as e:
-            logger.error(f"RAG indexing failed for {file.filename}: {e}")
-    
-    # Update project
+    # Update project (file_count is denormalized onto the project)
     await db.projects.update_one(
         {"id": project_id}, 
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}, "$inc": {"file_count": 1}}
     )
     
+    # RAG indexing after responding; poll /files/{id}/index-status for progress
+    if mime_type in RAG_INDEXABLE_MIME_TYPES:
+        run_in_background(index_file_version(
+            project_id, file_meta.id, file_meta.version, file.filename, mime_type, content=content
+        ))
+    
+    await bump_kb_version(project_id)
+    
     return file_meta
 
 @api_router.get("/projects/{project_id}/files", response_model=List[FileMetadata])
-async def get_project_files(project_id: str):
-    files = await db.files.find({"project_id": project_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+async def get_project_files(
+    project_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None)
+):
+    files = await paginate(db.files, {"project_id": project_id}, "created_at", -1, limit, cursor, response)
     return files
 
 @api_router.get("/files/{file_id}/download")
@@ -956,7 +1100,11 @@ async def delete_file(file_id: str):
     await db.file_versions.delete_many({"file_id": file_id})
     
     await storage.delete_file(file_meta["storage_path"])
-    await db.files.delete_one({"id": file_id})
+    result = await db.files.delete_one({"id": file_id})
+    if result.deleted_count:
+        await db.projects.update_one(
+            {"id": file_meta["project_id"]}, {"$inc": {"file_count": -1, "kb_version": 1}}
+        )
     
     return {"success": True}
 
@@ -1062,6 +1210,7 @@ async def restore_file_version(file_id: str, version_id: str):
     
     # Update file metadata
     new_version = current_version + 1
+    mime_type = get_mime_type(file_meta["original_filename"])
     update_data = {
         "filename": unique_filename,
         "file_size": version["file_size"],
@@ -1069,30 +1218,19 @@ async def restore_file_version(file_id: str, version_id: str):
         "content_preview": version.get("content_preview"),
         "version": new_version,
         "updated_at": datetime.now(timezone.utc).isoformat(),
-        "indexed": False
+        "indexed": False,
+        "index_status": "pending" if mime_type in RAG_INDEXABLE_MIME_TYPES else None
     }
     
     await db.files.update_one({"id": file_id}, {"$set": update_data})
     
-    # Re-index for RAG
-    if version.get("content_preview"):
-        try:
-            api_key = os.environ.get('EMERGENT_LLM_KEY', '')
-            rag_index = RAGIndex(db, file_meta["project_id"])
-            await rag_index.remove_document(file_id)
-            chunks_indexed = await rag_index.index_document(
-                file_id=file_id,
-                filename=file_meta["original_filename"],
-                content=version["content_preview"],
-                api_key=api_key
-            )
-            if chunks_indexed > 0:
-                await db.files.update_one(
-                    {"id": file_id},
-                    {"$set": {"indexed": True, "chunks_count": chunks_indexed}}
-                )
-        except Exception as e:
-            logger.error(f"RAG re-indexing failed after restore: {e}")
+    # Re-index for RAG after responding
+    if mime_type in RAG_INDEXABLE_MIME_TYPES:
+        run_in_background(index_file_version(
+            file_meta["project_id"], file_id, new_version, file_meta["original_filename"], mime_type, content=old_content
+        ))
+    
+    await bump_kb_version(file_meta["project_id"])
     
     return {
         "success": True,
@@ -1103,51 +1241,57 @@ async def restore_file_version(file_id: str, version_id: str):
 
 @api_router.post("/projects/{project_id}/reindex")
 async def reindex_project_files(project_id: str):
-    """Re-index all files in a project for RAG"""
+    """Re-index all files in a project for RAG; indexing runs in the background"""
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    files = await db.files.find({"project_id": project_id}, {"_id": 0}).to_list(100)
-    
-    api_key = os.environ.get('EMERGENT_LLM_KEY', '')
-    rag_index = RAGIndex(db, project_id)
-    
-    indexed_count = 0
-    total_chunks = 0
-    for f in files:
-        if f.get("content_preview"):
-            try:
-                # Force re-index by removing existing chunks first
-                await rag_index.remove_document(f["id"])
-                
-                chunks = await rag_index.index_document(
-                    file_id=f["id"],
-                    filename=f["original_filename"],
-                    content=f["content_preview"],
-                    api_key=api_key
-                )
-                if chunks > 0:
-                    await db.files.update_one(
-                        {"id": f["id"]},
-                        {"$set": {"indexed": True, "chunks_count": chunks}}
-                    )
-                    indexed_count += 1
-                    total_chunks += chunks
-                    logger.info(f"Indexed {f['original_filename']}: {chunks} chunks")
-            except Exception as e:
-                logger.error(f"Failed to index {f['original_filename']}: {e}")
-    
-    # Get stats
-    stats = await rag_index.get_stats()
+    files = db.files.find(
+        {"project_id": project_id},
+        {"_id": 0, "id": 1, "version": 1, "original_filename": 1, "mime_type": 1, "storage_path": 1}
+    )
+    queued = []
+    async for f in files:
+        mime_type = f.get("mime_type") or get_mime_type(f["original_filename"])
+        if mime_type in RAG_INDEXABLE_MIME_TYPES:
+            f["mime_type"] = mime_type
+            queued.append(f)
+    
+    if queued:
+        await db.files.update_many(
+            {"id": {"$in": [f["id"] for f in queued]}},
+            {"$set": {"index_status": "pending"}}
+        )
+        run_in_background(reindex_files(project_id, queued))
     
     return {
         "success": True,
-        "files_indexed": indexed_count,
-        "total_chunks": stats["total_chunks"]
+        "files_queued": len(queued)
     }
 
 
+async def reindex_files(project_id: str, files: List[Dict[str, Any]]):
+    """Index files one at a time from storage, dropping their existing chunks first"""
+    for f in files:
+        # Index the full stored document, not the preview
+        await index_file_version(
+            project_id, f["id"], f.get("version", 1), f["original_filename"], f["mime_type"],
+            storage_path=f["storage_path"], force=True
+        )
+
+
+@api_router.get("/files/{file_id}/index-status")
+async def get_file_index_status(file_id: str):
+    """Indexing progress of a file's current version"""
+    file_meta = await db.files.find_one(
+        {"id": file_id},
+        {"_id": 0, "id": 1, "version": 1, "indexed": 1, "index_status": 1, "chunks_count": 1, "failed_chunks": 1}
+    )
+    if not file_meta:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_meta
+
+
 @api_router.get("/projects/{project_id}/rag-stats")
 async def get_rag_stats(project_id: str):
     """Get RAG index statistics for a project"""
@@ -1155,6 +1299,77 @@ async def get_rag_stats(project_id: str):
     stats = await rag_index.get_stats()
     return stats
 
+
+@api_router.post("/rag/migrate-embeddings")
+async def migrate_rag_embeddings(user: User = Depends(require_auth)):
+    """Convert embeddings stored as BSON arrays to packed binary (admin only, safe to re-run)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    migrated = await migrate_embeddings_to_binary(db)
+    return {"success": True, "migrated": migrated}
+
+
+async def count_files_by_project(project_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """File count per project from one $group aggregation, optionally limited to project_ids"""
+    pipeline = [{"$group": {"_id": "$project_id", "count": {"$sum": 1}}}]
+    if project_ids is not None:
+        pipeline.insert(0, {"$match": {"project_id": {"$in": project_ids}}})
+    return {c["_id"]: c["count"] async for c in db.files.aggregate(pipeline)}
+
+
+async def backfill_project_file_counts():
+    """Set file_count on projects created before it was stored; a no-op once every project has one"""
+    missing = [p["id"] async for p in db.projects.find({"file_count": {"$exists": False}}, {"_id": 0, "id": 1})]
+    if not missing:
+        return
+    counts = await count_files_by_project(missing)
+    # Only fills absent counters, so a worker that already backfilled (or an upload's $inc) is never overwritten
+    await db.projects.bulk_write([
+        UpdateOne({"id": project_id, "file_count": {"$exists": False}}, {"$set": {"file_count": counts.get(project_id, 0)}})
+        for project_id in missing
+    ], ordered=False)
+    logger.info(f"Backfilled file_count for {len(missing)} projects")
+
+
+async def repair_project_file_counts() -> int:
+    """
+    Recompute each project's denormalized file_count from the files collection.
+    One aggregation finds the projects that drifted; each of those is recounted
+    and fixed with a compare-and-set on the value it replaces, so an upload or
+    delete that changes the count meanwhile is recounted, not overwritten.
+    Returns the number of projects corrected.
+    """
+    counts = await count_files_by_project()
+    repaired = 0
+    async for project in db.projects.find({}, {"_id": 0, "id": 1, "file_count": 1}):
+        if project.get("file_count") == counts.get(project["id"], 0):
+            continue
+        while project:
+            count = await db.files.count_documents({"project_id": project["id"]})
+            if project.get("file_count") == count:
+                break
+            result = await db.projects.update_one(
+                {"id": project["id"], "file_count": project.get("file_count")},
+                {"$set": {"file_count": count}}
+            )
+            if result.modified_count:
+                repaired += 1
+                break
+            project = await db.projects.find_one({"id": project["id"]}, {"_id": 0, "id": 1, "file_count": 1})
+    logger.info(f"Repaired file_count for {repaired} projects")
+    return repaired
+
+
+@api_router.post("/projects/repair-file-counts")
+async def repair_file_counts(user: User = Depends(require_auth)):
+    """Recompute every project's file_count (admin only, safe to re-run)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    repaired = await repair_project_file_counts()
+    return {"success": True, "repaired": repaired}
+
 # ============== CONVERSATION ROUTES ==============
 
 @api_router.post("/conversations", response_model=Conversation)
@@ -1186,16 +1401,30 @@ async def create_conversation(conv: ConversationBase, request: Request):
     return conv_obj
 
 @api_router.get("/projects/{project_id}/conversations", response_model=List[Conversation])
-async def get_project_conversations(project_id: str, request: Request):
+async def get_project_conversations(
+    project_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None)
+):
     user = await get_current_user(request)
     
     query = {"project_id": project_id}
     if user:
         query["$or"] = [{"user_id": user.user_id}, {"user_id": None}, {"user_id": {"$exists": False}}]
     
-    convos = await db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).to_list(100)
+    convos = await paginate(db.conversations, query, "updated_at", -1, limit, cursor, response)
     return convos
 
+async def get_project_names(project_ids) -> Dict[str, str]:
+    """Map project ids to names with a single $in query"""
+    ids = list({pid for pid in project_ids if pid})
+    if not ids:
+        return {}
+    projects = await db.projects.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    return {p["id"]: p["name"] for p in projects}
+
 @api_router.get("/conversations/recent", response_model=List[Dict[str, Any]])
 async def get_recent_conversations(request: Request, limit: int = Query(10, le=50)):
     user = await get_current_user(request)
@@ -1207,13 +1436,11 @@ async def get_recent_conversations(request: Request, limit: int = Query(10, le=5
     convos = await db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).to_list(limit)
     
     # Add project names
-    result = []
+    project_names = await get_project_names(c.get("project_id") for c in convos)
     for c in convos:
-        project = await db.projects.find_one({"id": c["project_id"]}, {"_id": 0, "name": 1})
-        c["project_name"] = project["name"] if project else "Unknown"
-        result.append(c)
+        c["project_name"] = project_names.get(c.get("project_id"), "Unknown")
     
-    return result
+    return convos
 
 @api_router.get("/conversations/{conversation_id}", response_model=Conversation)
 async def get_conversation(conversation_id: str, request: Request):
@@ -1250,7 +1477,14 @@ async def update_conversation(conversation_id: str, update: ConversationUpdate,
     return conv
 
 @api_router.get("/conversations", response_model=List[Dict[str, Any]])
-async def get_all_conversations(request: Request, starred: Optional[bool] = Query(None), archived: Optional[bool] = Query(None)):
+async def get_all_conversations(
+    request: Request,
+    response: Response,
+    starred: Optional[bool] = Query(None),
+    archived: Optional[bool] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None)
+):
     """Get all conversations with optional filtering"""
     user = await get_current_user(request)
     
@@ -1262,16 +1496,14 @@ async def get_all_conversations(request: Request, starred: Optional[bool] = Quer
     if archived is not None:
         query["archived"] = archived
         
-    convos = await db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).to_list(1000)
+    convos = await paginate(db.conversations, query, "updated_at", -1, limit, cursor, response)
     
     # Add project names
-    result = []
+    project_names = await get_project_names(c.get("project_id") for c in convos)
     for c in convos:
-        project = await db.projects.find_one({"id": c.get("project_id")}, {"_id": 0, "name": 1})
-        c["project_name"] = project["name"] if project else "No Project"
-        result.append(c)
+        c["project_name"] = project_names.get(c.get("project_id"), "No Project")
     
-    return result
+    return convos
 
 @api_router.put("/conversations/{conversation_id}/star")
 async def toggle_star_conversation(conversation_id: str, request: Request):
@@ -1307,11 +1539,17 @@ async def delete_conversation(conversation_id: str, request: Request):
 # ============== MESSAGE ROUTES ==============
 
 @api_router.get("/conversations/{conversation_id}/messages", response_model=List[Message])
-async def get_messages(conversation_id: str):
-    messages = await db.messages.find(
-        {"conversation_id": conversation_id}, {"_id": 0}
-    ).sort("created_at", 1).to_list(1000)
-    return messages
+async def get_messages(
+    conversation_id: str,
+    response: Response,
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = Query(None)
+):
+    """Newest page first, each page oldest-to-newest; the cursor steps back to earlier messages"""
+    messages = await paginate(
+        db.messages, {"conversation_id": conversation_id}, "created_at", -1, limit, cursor, response
+    )
+    return messages[::-1]
 
 # ============== CHAT WITH AI ==============
 
@@ -1334,12 +1572,7 @@ async def call_bedrock_converse(
     start_time = time.time()
     
     try:
-        bedrock_runtime = boto3.client(
-            service_name='bedrock-runtime',
-            region_name=aws_config['aws_region_name'],
-            aws_access_key_id=aws_config['aws_access_key_id'],
-            aws_secret_access_key=aws_config['aws_secret_access_key']
-        )
+        bedrock_runtime = get_bedrock_runtime(aws_config)
         
         # Convert messages to Bedrock format
         bedrock_messages = []
@@ -1431,7 +1664,8 @@ async def call_bedrock_converse(
         
         logger.info(f"Bedrock Converse API call: model={model_id}, messages={len(bedrock_messages)}, extended_thinking={extended_thinking and is_claude_model}")
         
-        response = bedrock_runtime.converse(**converse_params)
+        async with bedrock_model_slot(model_id):
+            response = await run_bedrock_call(bedrock_runtime.converse, **converse_params)
         
         elapsed_time = time.time() - start_time
         
@@ -1493,7 +1727,9 @@ async def perform_web_search(query: str) -> str:
     
     try:
         logger.info(f"Performing web search for: {query}")
-        response = tavily_client.search(
+        # The Tavily client is synchronous; keep it off the event loop
+        response = await asyncio.to_thread(
+            tavily_client.search,
             query=query,
             search_depth="basic",
             max_results=5,
@@ -1570,10 +1806,39 @@ def base64_to_pil(base64_data: str, media_type: str = "image/png") -> PILImage.I
     return PILImage.open(BytesIO(image_data))
 
 
-async def retrieve_kb_file_content(project_id: str, filename: str) -> str:
+def parse_kb_file(content_bytes: bytes, ext: str, page_headers: bool = False) -> Optional[str]:
+    """
+    Extract text from a knowledge base file (txt, md, pdf, docx); None for other types.
+    page_headers prefixes each non-empty PDF page with [Page N].
+    Parsing is CPU-bound, so async callers run this via asyncio.to_thread.
+    """
+    if ext in ['txt', 'md']:
+        return content_bytes.decode('utf-8', errors='ignore')
+    elif ext == 'pdf':
+        from PyPDF2 import PdfReader
+        import io
+        reader = PdfReader(io.BytesIO(content_bytes))
+        if not page_headers:
+            return "\n".join([page.extract_text() or "" for page in reader.pages])
+        pages_text = []
+        for i, page in enumerate(reader.pages):
+            page_text = page.extract_text() or ""
+            if page_text.strip():
+                pages_text.append(f"[Page {i+1}]\n{page_text}")
+        return "\n\n".join(pages_text)
+    elif ext == 'docx':
+        from docx import Document
+        import io
+        doc = Document(io.BytesIO(content_bytes))
+        return "\n".join([p.text for p in doc.paragraphs])
+    return None
+
+
+async def retrieve_kb_file_content(project_id: str, filename: str) -> Tuple[str, bool]:
     """
     Retrieve the full content of a specific file from the knowledge base.
     Called by Claude via tool use when it needs to access a file.
+    Returns (text, complete); complete is False unless the file was read.
     """
     try:
         # Find the file in the database
@@ -1584,86 +1849,61 @@ async def retrieve_kb_file_content(project_id: str, filename: str) -> str:
         
         if not file_record:
             # Try partial match
-            all_files = await db.files.find({"project_id": project_id}, {"_id": 0}).to_list(100)
-            for f in all_files:
+            async for f in db.files.find({"project_id": project_id}, {"_id": 0}):
                 if filename.lower() in f['original_filename'].lower():
                     file_record = f
                     break
         
         if not file_record:
-            return f"File '{filename}' not found in knowledge base."
+            return f"File '{filename}' not found in knowledge base.", False
         
         # Read full content from storage (works with both local and S3)
         try:
             content_bytes = await storage.get_file(file_record['storage_path'])
         except Exception as e:
-            return f"File '{filename}' exists in database but could not be read: {str(e)}"
+            return f"File '{filename}' exists in database but could not be read: {str(e)}", False
         
         ext = file_record['file_type'].lower()
         
-        if ext in ['txt', 'md']:
-            content = content_bytes.decode('utf-8', errors='ignore')
-        elif ext == 'pdf':
-            from PyPDF2 import PdfReader
-            import io
-            reader = PdfReader(io.BytesIO(content_bytes))
-            pages_text = []
-            for i, page in enumerate(reader.pages):
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    pages_text.append(f"[Page {i+1}]\n{page_text}")
-            content = "\n\n".join(pages_text)
-        elif ext == 'docx':
-            from docx import Document
-            import io
-            doc = Document(io.BytesIO(content_bytes))
-            content = "\n".join([p.text for p in doc.paragraphs])
-        else:
+        content = await asyncio.to_thread(parse_kb_file, content_bytes, ext, True)
+        if content is None:
             content = f"[Cannot extract text from {ext} files]"
         
         logger.info(f"KB file retrieved: {file_record['original_filename']}, {len(content)} chars")
-        return f"# {file_record['original_filename']}\n\n{content}"
+        return f"# {file_record['original_filename']}\n\n{content}", True
         
     except Exception as e:
         logger.error(f"KB file retrieval error: {e}")
-        return f"Error retrieving file: {str(e)}"
+        return f"Error retrieving file: {str(e)}", False
 
 
-async def search_within_kb_files(project_id: str, search_term: str) -> str:
+async def search_within_kb_files(project_id: str, search_term: str) -> Tuple[str, bool]:
     """
     Search for a term within all knowledge base files.
-    Returns matching excerpts from files that contain the term.
+    Returns matching excerpts from files that contain the term, and whether
+    every file was searched (False if any could not be read).
     """
     try:
-        all_files = await db.files.find(
+        all_files = db.files.find(
             {"project_id": project_id, "indexed": True},
             {"_id": 0}
-        ).to_list(100)
+        )
         
         results = []
-        for file_record in all_files:
+        complete = True
+        async for file_record in all_files:
             try:
                 # Read content from storage (works with both local and S3)
                 try:
                     content_bytes = await storage.get_file(file_record['storage_path'])
                 except Exception:
+                    complete = False
                     continue
                 
                 ext = file_record['file_type'].lower()
                 
-                if ext in ['txt', 'md']:
-                    content = content_bytes.decode('utf-8', errors='ignore')
-                elif ext == 'pdf':
-                    from PyPDF2 import PdfReader
-                    import io
-                    reader = PdfReader(io.BytesIO(content_bytes))
-                    content = "\n".join([page.extract_text() or "" for page in reader.pages])
-                elif ext == 'docx':
-                    from docx import Document
-                    import io
-                    doc = Document(io.BytesIO(content_bytes))
-                    content = "\n".join([p.text for p in doc.paragraphs])
-                else:
+                content = await asyncio.to_thread(parse_kb_file, content_bytes, ext)
+                if content is None:
                     continue
                 
                 # Search for term (case-insensitive)
@@ -1685,18 +1925,399 @@ async def search_within_kb_files(project_id: str, search_term: str) -> str:
                         results.append(f"## {file_record['original_filename']}\n\n" + "\n\n---\n\n".join(matching_lines))
             except Exception as e:
                 logger.error(f"Error searching {file_record['original_filename']}: {e}")
+                complete = False
                 continue
         
         if results:
             logger.info(f"KB search for '{search_term}' found matches in {len(results)} files")
-            return f"# Search results for '{search_term}'\n\n" + "\n\n===\n\n".join(results)
+            return f"# Search results for '{search_term}'\n\n" + "\n\n===\n\n".join(results), complete
         else:
-            return f"No matches found for '{search_term}' in the knowledge base."
+            return f"No matches found for '{search_term}' in the knowledge base.", complete
             
     except Exception as e:
         logger.error(f"KB search error: {e}")
-        return f"Error searching knowledge base: {str(e)}"
+        return f"Error searching knowledge base: {str(e)}", False
+
+
+async def bump_kb_version(project_id: str):
+    """Invalidate cached KB tool results for a project; call after its files change"""
+    await db.projects.update_one({"id": project_id}, {"$inc": {"kb_version": 1}})
+
+
+async def cached_kb_tool_result(
+    project_id: str,
+    tool_name: str,
+    arg: str,
+    compute: Callable[[], Awaitable[Tuple[str, bool]]]
+) -> str:
+    """
+    Serve a KB tool result from memory while the project's files are unchanged.
+    Keyed by (project, tool, normalized arg, kb_version); both KB tools match
+    case-insensitively, so the arg is case-folded. compute returns (text,
+    complete); only complete results are cached, so errors, unreadable files
+    and partial searches are retried next time.
+    """
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0, "kb_version": 1})
+    kb_version = project.get("kb_version", 0) if project else 0
+    key = (project_id, tool_name, normalize_query(arg).casefold(), kb_version)
+    
+    result = _tool_results.get(key)
+    if result is not None:
+        logger.info(f"Tool cache hit: {tool_name}('{arg}') in project {project_id}")
+        return result
+    
+    result, complete = await compute()
+    if complete:
+        _tool_results.put(key, result)
+    return result
+
+
+def load_crop_images(chat_images: Optional[List[dict]]) -> Dict[str, PILImage.Image]:
+    """Decode chat image attachments into PIL images for the crop_image tool"""
+    pil_images = {}
+    if chat_images:
+        for img in chat_images:
+            try:
+                pil_img = base64_to_pil(img['base64'], img.get('media_type', 'image/png'))
+                # Decode now so concurrent crops only ever read the pixel data
+                pil_img.load()
+                pil_images[img['name']] = pil_img
+                logger.info(f"Loaded image for cropping: {img['name']} ({pil_img.width}x{pil_img.height})")
+            except Exception as e:
+                logger.warning(f"Failed to load image {img.get('name', 'unknown')}: {e}")
+    return pil_images
+
+def build_bedrock_converse_params(
+    model_id: str,
+    messages: List[dict],
+    max_tokens: int,
+    extended_thinking: bool,
+    thinking_budget: int,
+    enable_web_search: bool,
+    enable_kb_tools: bool,
+    project_id: str,
+    temperature: float,
+    pil_images: Dict[str, PILImage.Image]
+) -> dict:
+    """
+    Build Converse API params: messages, system prompt, inference config and tools.
+    Shared by the blocking and streaming tool-use calls.
+    """
+    # Convert messages to Bedrock format
+    bedrock_messages = []
+    for msg in messages:
+        if msg['role'] == 'system':
+            continue
+        
+        content = msg['content']
+        
+        # Handle complex content (list with text and images from litellm format)
+        if isinstance(content, list):
+            bedrock_content = []
+            for item in content:
+                if isinstance(item, dict):
+                    if item.get('type') == 'text':
+                        bedrock_content.append({"text": item.get('text', '')})
+                    elif item.get('type') == 'image_url':
+                        # Parse base64 image from data URL
+                        img_url = item.get('image_url', {}).get('url', '')
+                        if img_url.startswith('data:'):
+                            parts = img_url.split(',', 1)
+                            if len(parts) == 2:
+                                header, b64_data = parts
+                                media_type = header.replace('data:', '').replace(';base64', '')
+                                # Map media type to Bedrock format
+                                format_map = {
+                                    'image/png': 'png',
+                                    'image/jpeg': 'jpeg',
+                                    'image/jpg': 'jpeg',
+                                    'image/gif': 'gif',
+                                    'image/webp': 'webp'
+                                }
+                                img_format = format_map.get(media_type, 'png')
+                                bedrock_content.append({
+                                    "image": {
+                                        "format": img_format,
+                                        "source": {
+                                            "bytes": base64.b64decode(b64_data)
+                                        }
+                                    }
+                                })
+                elif isinstance(item, str):
+                    bedrock_content.append({"text": item})
+            
+            if bedrock_content:
+                bedrock_messages.append({
+                    "role": msg['role'],
+                    "content": bedrock_content
+                })
+        else:
+            # Simple text content
+            content_text = content
+            if isinstance(content_text, bytes):
+                content_text = content_text.decode('utf-8', errors='replace')
+            bedrock_messages.append({
+                "role": msg['role'],
+                "content": [{"text": str(content_text)}]
+            })
+    
+    # Find system message
+    system_content = None
+    for msg in messages:
+        if msg['role'] == 'system':
+            sys_text = msg['content']
+            if isinstance(sys_text, bytes):
+                sys_text = sys_text.decode('utf-8', errors='replace')
+            system_content = [{"text": str(sys_text)}]
+            break
+    
+    # Build inference config
+    inference_config = {"maxTokens": max_tokens}
+    add_temp_params = True
+    additional_fields = {}
+    
+    is_claude_model = 'anthropic' in model_id.lower() or 'claude' in model_id.lower()
+    
+    # Extended thinking setup (same as before)
+    if extended_thinking and is_claude_model:
+        supports_thinking = any(x in model_id.lower() for x in [
+            'claude-3-7', 'claude-4', 'sonnet-4', 'opus-4', 'haiku-4',
+            'claude-sonnet-4', 'claude-opus-4', 'claude-haiku-4'
+        ])
+        if supports_thinking:
+            actual_budget = max(1024, thinking_budget)
+            additional_fields["thinking"] = {
+                "type": "enabled",
+                "budget_tokens": actual_budget
+            }
+            inference_config["maxTokens"] = actual_budget + 4000
+            add_temp_params = False
+            logger.info(f"Extended thinking enabled with budget: {actual_budget} tokens")
+    
+    # Only add temperature (not both temp and topP - Claude 4 doesn't allow both)
+    if add_temp_params:
+        inference_config["temperature"] = temperature
+        # Note: Bedrock Converse API for Claude doesn't support topP when temperature is set
+    
+    # Build tools list
+    tools_list = []
+    
+    # Web search tool
+    if enable_web_search and tavily_client:
+        tools_list.append({
+            "toolSpec": {
+                "name": "web_search",
+                "description": "Search the web for current information, news, facts, or any topic. Use this when you need up-to-date information or don't have knowledge about something.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "The search query to look up on the web"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                }
+            }
+        })
+        logger.info("Web search tool enabled")
+    
+    # Knowledge Base tools
+    if enable_kb_tools and project_id:
+        tools_list.append({
+            "toolSpec": {
+                "name": "get_kb_file",
+                "description": "Retrieve the complete contents of a specific file from the knowledge base. Use this when you need to reference, check, or quote information from a file in the knowledge base.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "filename": {
+                                "type": "string",
+                                "description": "The name (or partial name) of the file to retrieve from the knowledge base"
+                            }
+                        },
+                        "required": ["filename"]
+                    }
+                }
+            }
+        })
+        tools_list.append({
+            "toolSpec": {
+                "name": "search_kb",
+                "description": "Search for a specific term or phrase across all files in the knowledge base. Use this to find information without loading entire files, or to check if a word/phrase appears in any reference document.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "search_term": {
+                                "type": "string",
+                                "description": "The term or phrase to search for in the knowledge base files"
+                            }
+                        },
+                        "required": ["search_term"]
+                    }
+                }
+            }
+        })
+        logger.info("Knowledge base tools enabled")
+    
+    # Crop image tool (only if images are available)
+    if pil_images:
+        image_names = list(pil_images.keys())
+        tools_list.append({
+            "toolSpec": {
+                "name": "crop_image",
+                "description": f"Crop a region of an image to examine it in more detail. Use this when you need to zoom in on a specific area of an image. Available images: {', '.join(image_names)}. Coordinates are normalized (0-1), where (0,0) is top-left and (1,1) is bottom-right.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "image_name": {
+                                "type": "string",
+                                "description": f"Name of the image to crop. Available: {', '.join(image_names)}"
+                            },
+                            "x1": {
+                                "type": "number",
+                                "minimum": 0,
+                                "maximum": 1,
+                                "description": "Left edge of bounding box as normalized 0-1 value"
+                            },
+                            "y1": {
+                                "type": "number",
+                                "minimum": 0,
+                                "maximum": 1,
+                                "description": "Top edge of bounding box as normalized 0-1 value"
+                            },
+                            "x2": {
+                                "type": "number",
+                                "minimum": 0,
+                                "maximum": 1,
+                                "description": "Right edge of bounding box as normalized 0-1 value"
+                            },
+                            "y2": {
+                                "type": "number",
+                                "minimum": 0,
+                                "maximum": 1,
+                                "description": "Bottom edge of bounding box as normalized 0-1 value"
+                            }
+                        },
+                        "required": ["image_name", "x1", "y1", "x2", "y2"]
+                    }
+                }
+            }
+        })
+        logger.info(f"Crop image tool enabled with {len(pil_images)} image(s): {image_names}")
+    
+    tool_config = {"tools": tools_list} if tools_list else None
+    
+    # Build converse params
+    converse_params = {
+        "modelId": model_id,
+        "messages": bedrock_messages,
+        "inferenceConfig": inference_config
+    }
+    
+    if system_content:
+        converse_params["system"] = system_content
+    if additional_fields:
+        converse_params["additionalModelRequestFields"] = additional_fields
+    if tool_config:
+        converse_params["toolConfig"] = tool_config
+    
+    
+    return converse_params
+
+async def execute_bedrock_tool(tool_use: dict, project_id: str, pil_images: Dict[str, PILImage.Image]) -> dict:
+    """Run one toolUse request from the model and return its toolResult block"""
+    tool_name = tool_use.get('name')
+    tool_id = tool_use.get('toolUseId')
+    tool_input = tool_use.get('input', {})
+    
+    # Handle web search tool
+    if tool_name == 'web_search':
+        query = tool_input.get('query', '')
+        logger.info(f"Executing web search: {query}")
+        content = [{"text": await perform_web_search(query)}]
+    
+    # Handle KB file retrieval tool
+    elif tool_name == 'get_kb_file':
+        filename = tool_input.get('filename', '')
+        logger.info(f"Retrieving KB file: {filename}")
+        result = await cached_kb_tool_result(
+            project_id, tool_name, filename, lambda: retrieve_kb_file_content(project_id, filename)
+        )
+        content = [{"text": result}]
+    
+    # Handle KB search tool
+    elif tool_name == 'search_kb':
+        search_term = tool_input.get('search_term', '')
+        logger.info(f"Searching KB for: {search_term}")
+        result = await cached_kb_tool_result(
+            project_id, tool_name, search_term, lambda: search_within_kb_files(project_id, search_term)
+        )
+        content = [{"text": result}]
+    
+    # Handle crop image tool
+    elif tool_name == 'crop_image':
+        image_name = tool_input.get('image_name', '')
+        x1 = tool_input.get('x1', 0)
+        y1 = tool_input.get('y1', 0)
+        x2 = tool_input.get('x2', 1)
+        y2 = tool_input.get('y2', 1)
+        logger.info(f"Cropping image '{image_name}': ({x1:.2f},{y1:.2f})-({x2:.2f},{y2:.2f})")
+        
+        if image_name not in pil_images:
+            # Try fuzzy match
+            matched = None
+            for name in pil_images:
+                if image_name.lower() in name.lower() or name.lower() in image_name.lower():
+                    matched = name
+                    break
+            if not matched:
+                return {
+                    "toolResult": {
+                        "toolUseId": tool_id,
+                        "content": [{"text": f"Error: Image '{image_name}' not found. Available images: {list(pil_images.keys())}"}]
+                    }
+                }
+            image_name = matched
+        
+        crop_result = await asyncio.to_thread(handle_crop_image, pil_images[image_name], x1, y1, x2, y2)
+        content = [{"text": crop_result['text']}]
+        if crop_result['success']:
+            # Return both text description and the cropped image
+            content.append({
+                "image": {
+                    "format": "png",
+                    "source": {
+                        "bytes": base64.b64decode(crop_result['image']['data'])
+                    }
+                }
+            })
+    
+    else:
+        logger.warning(f"Model requested unknown tool: {tool_name}")
+        content = [{"text": f"Error: Unknown tool '{tool_name}'"}]
+    
+    return {"toolResult": {"toolUseId": tool_id, "content": content}}
 
+async def execute_bedrock_tools(tool_uses: List[dict], project_id: str, pil_images: Dict[str, PILImage.Image]) -> List[dict]:
+    """
+    Run the tool calls from one assistant turn concurrently, at most
+    BEDROCK_TOOL_CONCURRENCY at a time. Results come back in request order.
+    """
+    semaphore = asyncio.Semaphore(BEDROCK_TOOL_CONCURRENCY)
+    
+    async def run(tool_use: dict) -> dict:
+        async with semaphore:
+            return await execute_bedrock_tool(tool_use, project_id, pil_images)
+    
+    if len(tool_uses) > 1:
+        logger.info(f"Running {len(tool_uses)} tool calls concurrently: {[t.get('name') for t in tool_uses]}")
+    return list(await asyncio.gather(*(run(tool_use) for tool_use in tool_uses)))
 
 async def call_bedrock_converse_with_tools(
     model_id: str, 
@@ -1725,250 +2346,19 @@ async def call_bedrock_converse_with_tools(
     start_time = time.time()
     
     # Store PIL images for cropping
-    pil_images = {}
-    if chat_images:
-        for img in chat_images:
-            try:
-                pil_img = base64_to_pil(img['base64'], img.get('media_type', 'image/png'))
-                pil_images[img['name']] = pil_img
-                logger.info(f"Loaded image for cropping: {img['name']} ({pil_img.width}x{pil_img.height})")
-            except Exception as e:
-                logger.warning(f"Failed to load image {img.get('name', 'unknown')}: {e}")
+    pil_images = load_crop_images(chat_images)
     
     try:
-        bedrock_runtime = boto3.client(
-            service_name='bedrock-runtime',
-            region_name=aws_config['aws_region_name'],
-            aws_access_key_id=aws_config['aws_access_key_id'],
-            aws_secret_access_key=aws_config['aws_secret_access_key']
-        )
-        
-        # Convert messages to Bedrock format
-        bedrock_messages = []
-        for msg in messages:
-            if msg['role'] == 'system':
-                continue
-            
-            content = msg['content']
-            
-            # Handle complex content (list with text and images from litellm format)
-            if isinstance(content, list):
-                bedrock_content = []
-                for item in content:
-                    if isinstance(item, dict):
-                        if item.get('type') == 'text':
-                            bedrock_content.append({"text": item.get('text', '')})
-                        elif item.get('type') == 'image_url':
-                            # Parse base64 image from data URL
-                            img_url = item.get('image_url', {}).get('url', '')
-                            if img_url.startswith('data:'):
-                                parts = img_url.split(',', 1)
-                                if len(parts) == 2:
-                                    header, b64_data = parts
-                                    media_type = header.replace('data:', '').replace(';base64', '')
-                                    # Map media type to Bedrock format
-                                    format_map = {
-                                        'image/png': 'png',
-                                        'image/jpeg': 'jpeg',
-                                        'image/jpg': 'jpeg',
-                                        'image/gif': 'gif',
-                                        'image/webp': 'webp'
-                                    }
-                                    img_format = format_map.get(media_type, 'png')
-                                    bedrock_content.append({
-                                        "image": {
-                                            "format": img_format,
-                                            "source": {
-                                                "bytes": base64.b64decode(b64_data)
-                                            }
-                                        }
-                                    })
-                    elif isinstance(item, str):
-                        bedrock_content.append({"text": item})
-                
-                if bedrock_content:
-                    bedrock_messages.append({
-                        "role": msg['role'],
-                        "content": bedrock_content
-                    })
-            else:
-                # Simple text content
-                content_text = content
-                if isinstance(content_text, bytes):
-                    content_text = content_text.decode('utf-8', errors='replace')
-                bedrock_messages.append({
-                    "role": msg['role'],
-                    "content": [{"text": str(content_text)}]
-                })
-        
-        # Find system message
-        system_content = None
-        for msg in messages:
-            if msg['role'] == 'system':
-                sys_text = msg['content']
-                if isinstance(sys_text, bytes):
-                    sys_text = sys_text.decode('utf-8', errors='replace')
-                system_content = [{"text": str(sys_text)}]
-                break
+        bedrock_runtime = get_bedrock_runtime(aws_config)
         
-        # Build inference config
-        inference_config = {"maxTokens": max_tokens}
-        add_temp_params = True
-        additional_fields = {}
-        
-        is_claude_model = 'anthropic' in model_id.lower() or 'claude' in model_id.lower()
+        converse_params = build_bedrock_converse_params(
+            model_id, messages, max_tokens, extended_thinking, thinking_budget,
+            enable_web_search, enable_kb_tools, project_id, temperature, pil_images
+        )
+        bedrock_messages = converse_params["messages"]
         thinking_content = None
         thinking_time = None
         
-        # Extended thinking setup (same as before)
-        if extended_thinking and is_claude_model:
-            supports_thinking = any(x in model_id.lower() for x in [
-                'claude-3-7', 'claude-4', 'sonnet-4', 'opus-4', 'haiku-4',
-                'claude-sonnet-4', 'claude-opus-4', 'claude-haiku-4'
-            ])
-            if supports_thinking:
-                actual_budget = max(1024, thinking_budget)
-                additional_fields["thinking"] = {
-                    "type": "enabled",
-                    "budget_tokens": actual_budget
-                }
-                inference_config["maxTokens"] = actual_budget + 4000
-                add_temp_params = False
-                logger.info(f"Extended thinking enabled with budget: {actual_budget} tokens")
-        
-        # Only add temperature (not both temp and topP - Claude 4 doesn't allow both)
-        if add_temp_params:
-            inference_config["temperature"] = temperature
-            # Note: Bedrock Converse API for Claude doesn't support topP when temperature is set
-        
-        # Build tools list
-        tools_list = []
-        
-        # Web search tool
-        if enable_web_search and tavily_client:
-            tools_list.append({
-                "toolSpec": {
-                    "name": "web_search",
-                    "description": "Search the web for current information, news, facts, or any topic. Use this when you need up-to-date information or don't have knowledge about something.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "query": {
-                                    "type": "string",
-                                    "description": "The search query to look up on the web"
-                                }
-                            },
-                            "required": ["query"]
-                        }
-                    }
-                }
-            })
-            logger.info("Web search tool enabled")
-        
-        # Knowledge Base tools
-        if enable_kb_tools and project_id:
-            tools_list.append({
-                "toolSpec": {
-                    "name": "get_kb_file",
-                    "description": "Retrieve the complete contents of a specific file from the knowledge base. Use this when you need to reference, check, or quote information from a file in the knowledge base.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "filename": {
-                                    "type": "string",
-                                    "description": "The name (or partial name) of the file to retrieve from the knowledge base"
-                                }
-                            },
-                            "required": ["filename"]
-                        }
-                    }
-                }
-            })
-            tools_list.append({
-                "toolSpec": {
-                    "name": "search_kb",
-                    "description": "Search for a specific term or phrase across all files in the knowledge base. Use this to find information without loading entire files, or to check if a word/phrase appears in any reference document.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "search_term": {
-                                    "type": "string",
-                                    "description": "The term or phrase to search for in the knowledge base files"
-                                }
-                            },
-                            "required": ["search_term"]
-                        }
-                    }
-                }
-            })
-            logger.info("Knowledge base tools enabled")
-        
-        # Crop image tool (only if images are available)
-        if pil_images:
-            image_names = list(pil_images.keys())
-            tools_list.append({
-                "toolSpec": {
-                    "name": "crop_image",
-                    "description": f"Crop a region of an image to examine it in more detail. Use this when you need to zoom in on a specific area of an image. Available images: {', '.join(image_names)}. Coordinates are normalized (0-1), where (0,0) is top-left and (1,1) is bottom-right.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "image_name": {
-                                    "type": "string",
-                                    "description": f"Name of the image to crop. Available: {', '.join(image_names)}"
-                                },
-                                "x1": {
-                                    "type": "number",
-                                    "minimum": 0,
-                                    "maximum": 1,
-                                    "description": "Left edge of bounding box as normalized 0-1 value"
-                                },
-                                "y1": {
-                                    "type": "number",
-                                    "minimum": 0,
-                                    "maximum": 1,
-                                    "description": "Top edge of bounding box as normalized 0-1 value"
-                                },
-                                "x2": {
-                                    "type": "number",
-                                    "minimum": 0,
-                                    "maximum": 1,
-                                    "description": "Right edge of bounding box as normalized 0-1 value"
-                                },
-                                "y2": {
-                                    "type": "number",
-                                    "minimum": 0,
-                                    "maximum": 1,
-                                    "description": "Bottom edge of bounding box as normalized 0-1 value"
-                                }
-                            },
-                            "required": ["image_name", "x1", "y1", "x2", "y2"]
-                        }
-                    }
-                }
-            })
-            logger.info(f"Crop image tool enabled with {len(pil_images)} image(s): {image_names}")
-        
-        tool_config = {"tools": tools_list} if tools_list else None
-        
-        # Build converse params
-        converse_params = {
-            "modelId": model_id,
-            "messages": bedrock_messages,
-            "inferenceConfig": inference_config
-        }
-        
-        if system_content:
-            converse_params["system"] = system_content
-        if additional_fields:
-            converse_params["additionalModelRequestFields"] = additional_fields
-        if tool_config:
-            converse_params["toolConfig"] = tool_config
-        
         logger.info(f"Bedrock Converse API call: model={model_id}, messages={len(bedrock_messages)}, web_search={enable_web_search}, kb_tools={enable_kb_tools}")
         
         # Call Bedrock and handle tool use loop
@@ -1977,7 +2367,9 @@ async def call_bedrock_converse_with_tools(
         
         while iteration < max_iterations:
             iteration += 1
-            response = bedrock_runtime.converse(**converse_params)
+            # The slot is held for the model call only, not while tools run
+            async with bedrock_model_slot(model_id):
+                response = await run_bedrock_call(bedrock_runtime.converse, **converse_params)
             
             stop_reason = response.get('stopReason', 'unknown')
             output_message = response.get('output', {}).get('message', {})
@@ -1988,109 +2380,11 @@ async def call_bedrock_converse_with_tools(
                 logger.info("Model requested tool use")
                 
                 # Find tool use blocks
-                tool_results = []
                 assistant_content = []
                 
                 for block in content_blocks:
                     if 'toolUse' in block:
-                        tool_use = block['toolUse']
-                        tool_name = tool_use.get('name')
-                        tool_id = tool_use.get('toolUseId')
-                        tool_input = tool_use.get('input', {})
-                        
                         assistant_content.append(block)
-                        
-                        # Handle web search tool
-                        if tool_name == 'web_search':
-                            query = tool_input.get('query', '')
-                            logger.info(f"Executing web search: {query}")
-                            search_result = await perform_web_search(query)
-                            tool_results.append({
-                                "toolResult": {
-                                    "toolUseId": tool_id,
-                                    "content": [{"text": search_result}]
-                                }
-                            })
-                        
-                        # Handle KB file retrieval tool
-                        elif tool_name == 'get_kb_file':
-                            filename = tool_input.get('filename', '')
-                            logger.info(f"Retrieving KB file: {filename}")
-                            file_content = await retrieve_kb_file_content(project_id, filename)
-                            tool_results.append({
-                                "toolResult": {
-                                    "toolUseId": tool_id,
-                                    "content": [{"text": file_content}]
-                                }
-                            })
-                        
-                        # Handle KB search tool
-                        elif tool_name == 'search_kb':
-                            search_term = tool_input.get('search_term', '')
-                            logger.info(f"Searching KB for: {search_term}")
-                            search_result = await search_within_kb_files(project_id, search_term)
-                            tool_results.append({
-                                "toolResult": {
-                                    "toolUseId": tool_id,
-                                    "content": [{"text": search_result}]
-                                }
-                            })
-                        
-                        # Handle crop image tool
-                        elif tool_name == 'crop_image':
-                            image_name = tool_input.get('image_name', '')
-                            x1 = tool_input.get('x1', 0)
-                            y1 = tool_input.get('y1', 0)
-                            x2 = tool_input.get('x2', 1)
-                            y2 = tool_input.get('y2', 1)
-                            logger.info(f"Cropping image '{image_name}': ({x1:.2f},{y1:.2f})-({x2:.2f},{y2:.2f})")
-                            
-                            if image_name not in pil_images:
-                                # Try fuzzy match
-                                matched = None
-                                for name in pil_images:
-                                    if image_name.lower() in name.lower() or name.lower() in image_name.lower():
-                                        matched = name
-                                        break
-                                if matched:
-                                    image_name = matched
-                                else:
-                                    tool_results.append({
-                                        "toolResult": {
-                                            "toolUseId": tool_id,
-                                            "content": [{"text": f"Error: Image '{image_name}' not found. Available images: {list(pil_images.keys())}"}]
-                                        }
-                                    })
-                                    continue
-                            
-                            crop_result = handle_crop_image(pil_images[image_name], x1, y1, x2, y2)
-                            
-                            if crop_result['success']:
-                                # Return both text description and the cropped image
-                                tool_results.append({
-                                    "toolResult": {
-                                        "toolUseId": tool_id,
-                                        "content": [
-                                            {"text": crop_result['text']},
-                                            {
-                                                "image": {
-                                                    "format": "png",
-                                                    "source": {
-                                                        "bytes": base64.b64decode(crop_result['image']['data'])
-                                                    }
-                                                }
-                                            }
-                                        ]
-                                    }
-                                })
-                            else:
-                                tool_results.append({
-                                    "toolResult": {
-                                        "toolUseId": tool_id,
-                                        "content": [{"text": crop_result['text']}]
-                                    }
-                                })
-                        
                     elif 'text' in block:
                         assistant_content.append(block)
                     elif 'thinking' in block:
@@ -2098,6 +2392,11 @@ async def call_bedrock_converse_with_tools(
                         thinking_time = round(time.time() - start_time)
                         assistant_content.append(block)
                 
+                # Run this turn's tool calls together
+                tool_results = await execute_bedrock_tools(
+                    [block['toolUse'] for block in content_blocks if 'toolUse' in block], project_id, pil_images
+                )
+                
                 # Add assistant message with tool use to conversation
                 bedrock_messages.append({
                     "role": "assistant",
@@ -2162,6 +2461,119 @@ async def call_bedrock_converse_with_tools(
         logger.error(f"Bedrock Converse API error: {type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"Bedrock API error: {str(e)}")
 
+async def stream_bedrock_converse_with_tools(
+    model_id: str, 
+    messages: List[dict], 
+    aws_config: dict, 
+    max_tokens: int = 4000,
+    extended_thinking: bool = False,
+    thinking_budget: int = 10000,
+    enable_web_search: bool = False,
+    enable_kb_tools: bool = False,
+    project_id: str = None,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    chat_images: List[dict] = None
+) -> AsyncIterator[dict]:
+    """
+    Streaming counterpart of call_bedrock_converse_with_tools, built on ConverseStream.
+    Yields {"type": "thinking" | "text", "delta": str} as the model generates and
+    {"type": "tool", "status": "running" | "done", "name": str, ...} around each tool call.
+    """
+    pil_images = load_crop_images(chat_images)
+    
+    bedrock_runtime = get_bedrock_runtime(aws_config)
+    
+    converse_params = build_bedrock_converse_params(
+        model_id, messages, max_tokens, extended_thinking, thinking_budget,
+        enable_web_search, enable_kb_tools, project_id, temperature, pil_images
+    )
+    bedrock_messages = converse_params["messages"]
+    
+    logger.info(f"Bedrock ConverseStream call: model={model_id}, messages={len(bedrock_messages)}, web_search={enable_web_search}, kb_tools={enable_kb_tools}")
+    
+    max_iterations = 5  # Same tool budget as the blocking call
+    for iteration in range(1, max_iterations + 1):
+        # contentBlockIndex -> block rebuilt from deltas, replayed to the model on tool use
+        blocks = {}
+        stop_reason = None
+        usage = {}
+        
+        # The slot is held while the model generates, not while tools run
+        async with bedrock_model_slot(model_id):
+            response = await run_bedrock_call(bedrock_runtime.converse_stream, **converse_params)
+            # The event stream is a blocking iterator; each read runs on the converse executor
+            stream = iter(response['stream'])
+            try:
+                while True:
+                    event = await run_bedrock_call(next, stream, None)
+                    if event is None:
+                        break
+                    
+                    if 'contentBlockStart' in event:
+                        start = event['contentBlockStart']
+                        tool_use = start.get('start', {}).get('toolUse')
+                        if tool_use:
+                            blocks[start['contentBlockIndex']] = {
+                                "toolUse": {"toolUseId": tool_use['toolUseId'], "name": tool_use['name'], "input": ""}
+                            }
+                    
+                    elif 'contentBlockDelta' in event:
+                        index = event['contentBlockDelta']['contentBlockIndex']
+                        delta = event['contentBlockDelta']['delta']
+                        
+                        if 'text' in delta:
+                            block = blocks.setdefault(index, {"text": ""})
+                            block["text"] += delta['text']
+                            yield {"type": "text", "delta": delta['text']}
+                        
+                        elif 'reasoningContent' in delta:
+                            rc = delta['reasoningContent']
+                            if 'redactedContent' in rc:
+                                blocks[index] = {"reasoningContent": {"redactedContent": rc['redactedContent']}}
+                                continue
+                            reasoning = blocks.setdefault(
+                                index, {"reasoningContent": {"reasoningText": {"text": ""}}}
+                            )["reasoningContent"]["reasoningText"]
+                            if rc.get('text'):
+                                reasoning["text"] += rc['text']
+                                yield {"type": "thinking", "delta": rc['text']}
+                            if 'signature' in rc:
+                                reasoning["signature"] = rc['signature']
+                        
+                        elif 'toolUse' in delta:
+                            # Tool input arrives as JSON fragments
+                            blocks[index]["toolUse"]["input"] += delta['toolUse'].get('input', '')
+                    
+                    elif 'messageStop' in event:
+                        stop_reason = event['messageStop'].get('stopReason')
+                    
+                    elif 'metadata' in event:
+                        usage = event['metadata'].get('usage', {})
+            finally:
+                response['stream'].close()
+        
+        content_blocks = [blocks[index] for index in sorted(blocks)]
+        
+        if stop_reason != 'tool_use':
+            logger.info(f"Bedrock ConverseStream success: model={model_id}, blocks={len(content_blocks)}, iterations={iteration}, stop_reason={stop_reason}, usage={usage}")
+            return
+        
+        logger.info("Model requested tool use")
+        tool_uses = [block['toolUse'] for block in content_blocks if 'toolUse' in block]
+        for tool_use in tool_uses:
+            tool_use['input'] = json.loads(tool_use['input']) if tool_use['input'] else {}
+            yield {"type": "tool", "status": "running", "name": tool_use['name'], "input": tool_use['input']}
+        tool_results = await execute_bedrock_tools(tool_uses, project_id, pil_images)
+        for tool_use in tool_uses:
+            yield {"type": "tool", "status": "done", "name": tool_use['name']}
+        
+        bedrock_messages.append({"role": "assistant", "content": content_blocks})
+        bedrock_messages.append({"role": "user", "content": tool_results})
+    
+    logger.warning(f"Max tool use iterations ({max_iterations}) reached")
+    yield {"type": "text", "delta": "I encountered an issue processing your request. Please try again."}
+
 def get_llm_config(project: dict, llm_provider_override: str = None):
     """
     Get LLM configuration based on provider setting.
@@ -2252,6 +2664,114 @@ def get_llm_config(project: dict, llm_provider_override: str = None):
             {"supports_extended_features": use_direct_anthropic}
         )
 
+async def stream_litellm_completion(params: dict) -> AsyncIterator[dict]:
+    """Stream a litellm completion as thinking/text delta events"""
+    import litellm
+    
+    response = await litellm.acompletion(**params, stream=True)
+    async for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        # litellm normalizes Anthropic thinking deltas to reasoning_content
+        reasoning = getattr(delta, 'reasoning_content', None)
+        if reasoning:
+            yield {"type": "thinking", "delta": reasoning}
+        if delta.content:
+            yield {"type": "text", "delta": delta.content}
+
+async def stream_single_response(response: Awaitable[str]) -> AsyncIterator[dict]:
+    """Adapt a provider without streaming support to the chat event stream"""
+    yield {"type": "text", "delta": await response}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def save_assistant_message(conversation_id: str, response_text: str, thinking_content: str = None, thinking_time: int = None) -> dict:
+    """Persist an assistant reply (with thinking, if any) and bump the conversation timestamp"""
+    msg_data = {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "role": "assistant",
+        "content": response_text,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    
+    if thinking_content:
+        msg_data["thinking"] = thinking_content
+        msg_data["thinking_time"] = thinking_time
+    
+    await db.messages.insert_one(msg_data)
+    
+    # Update conversation timestamp
+    await db.conversations.update_one(
+        {"id": conversation_id},
+        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    
+    return msg_data
+
+def chat_event_stream(conversation_id: str, events: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Relay provider events to the client as server-sent events:
+    thinking/text ({"delta"}), tool ({"status", "name", ...}), then done ({"message_id", ...})
+    once the reply is persisted, or error ({"detail"}) if the provider fails mid-stream.
+    A running tool ends the model's turn, so text and thinking streamed before it are
+    dropped and only the final turn is saved, as in the non-streaming path.
+    The provider is consumed by a background task, so the reply is still generated and
+    saved if the client disconnects.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def produce():
+        import time
+        start_time = time.time()
+        text_parts = []
+        thinking_parts = []
+        thinking_time = None
+        
+        try:
+            async for event in events:
+                event_type = event.pop("type")
+                if event_type == "text":
+                    text_parts.append(event["delta"])
+                elif event_type == "thinking":
+                    thinking_parts.append(event["delta"])
+                    thinking_time = round(time.time() - start_time)
+                elif event_type == "tool" and event["status"] == "running":
+                    text_parts = []
+                    thinking_parts = []
+                queue.put_nowait(sse_event(event_type, event))
+            
+            thinking_content = "".join(thinking_parts) or None
+            msg_data = await save_assistant_message(conversation_id, "".join(text_parts), thinking_content, thinking_time)
+            
+            done = {"message_id": msg_data["id"]}
+            if thinking_content:
+                done["thinking_time"] = thinking_time
+            queue.put_nowait(sse_event("done", done))
+        except Exception as e:
+            logger.error(f"Chat stream error: {type(e).__name__}: {e}")
+            queue.put_nowait(sse_event("error", {"detail": f"AI chat error: {str(e)}"}))
+        finally:
+            queue.put_nowait(None)
+    
+    run_in_background(produce())
+    
+    async def relay():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            yield item
+    
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.post("/chat")
 async def chat_with_ai(request: ChatRequest):
     # Get conversation
@@ -2421,7 +2941,7 @@ When the user asks you to edit something or check against style guides, proactiv
                 bedrock_web_search = False
                 bedrock_kb_tools = False
             
-            response_text, thinking_content, thinking_time = await call_bedrock_converse_with_tools(
+            bedrock_kwargs = dict(
                 model_id=bedrock_model_id,
                 messages=messages_for_llm,
                 aws_config=extra_config,
@@ -2434,6 +2954,10 @@ When the user asks you to edit something or check against style guides, proactiv
                 temperature=project.get("temperature", 0.7),
                 top_p=project.get("top_p", 0.9)
             )
+            if request.stream:
+                return chat_event_stream(request.conversation_id, stream_bedrock_converse_with_tools(**bedrock_kwargs))
+            
+            response_text, thinking_content, thinking_time = await call_bedrock_converse_with_tools(**bedrock_kwargs)
         elif provider_type in ["openai-gpt5", "gemini"]:
             # Use Emergent LLM Key with emergentintegrations library
             emergent_provider = extra_config.get("emergent_provider", "openai")
@@ -2460,13 +2984,20 @@ When the user asks you to edit something or check against style guides, proactiv
             
             user_message = UserMessage(text=history_context + request.message)
             
+            if request.stream:
+                # No incremental output from this client; the reply arrives as a single text event
+                return chat_event_stream(request.conversation_id, stream_single_response(chat.send_message(user_message)))
+            
             # Send message and get response
             response_text = await chat.send_message(user_message)
             thinking_content = None
             thinking_time = None
         else:
             # Use litellm for Anthropic Direct API
-            logger.info(f"Using litellm: model={model_name}")
+            logger.info(f"Using litellm: model={model_name}, stream={request.stream}")
+            if request.stream:
+                return chat_event_stream(request.conversation_id, stream_litellm_completion(params))
+            
             llm_response = await litellm.acompletion(**params)
             elapsed_time = time.time() - start_time
             
@@ -2508,25 +3039,7 @@ When the user asks you to edit something or check against style guides, proactiv
                             logger.info(f"Found thinking in provider_specific_fields")
         
         # Save assistant message (include thinking in metadata if present)
-        msg_data = {
-            "id": str(uuid.uuid4()),
-            "conversation_id": request.conversation_id,
-            "role": "assistant",
-            "content": response_text,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        if thinking_content:
-            msg_data["thinking"] = thinking_content
-            msg_data["thinking_time"] = thinking_time
-        
-        await db.messages.insert_one(msg_data)
-        
-        # Update conversation timestamp
-        await db.conversations.update_one(
-            {"id": request.conversation_id},
-            {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        msg_data = await save_assistant_message(request.conversation_id, response_text, thinking_content, thinking_time)
         
         result = {
             "response": response_text, 
@@ -2552,9 +3065,10 @@ async def chat_with_files(
     extended_thinking: bool = Form(False),
     thinking_budget: int = Form(10000),
     web_search: bool = Form(False),
+    stream: bool = Form(False),
     files: List[UploadFile] = File(default=[])
 ):
-    """Chat endpoint with file attachments"""
+    """Chat endpoint with file attachments; stream=true responds with server-sent events like /chat"""
     import base64
     import litellm
     import time
@@ -2772,22 +3286,26 @@ async def chat_with_files(
         
         logger.info(f"Using Bedrock with files: model={bedrock_model_id}, extended_thinking={bedrock_extended_thinking}, crop_images={len(chat_images)}")
         
+        bedrock_kwargs = dict(
+            model_id=bedrock_model_id,
+            messages=messages_for_llm,
+            aws_config=extra_config,
+            max_tokens=4000,
+            extended_thinking=bedrock_extended_thinking,
+            thinking_budget=thinking_budget,
+            enable_web_search=bedrock_web_search,
+            enable_kb_tools=False,  # KB tools use different system for file attachments
+            project_id=conv["project_id"],
+            temperature=project.get("temperature", 0.7),
+            top_p=project.get("top_p", 0.9),
+            chat_images=chat_images if chat_images else None
+        )
+        if stream:
+            return chat_event_stream(conversation_id, stream_bedrock_converse_with_tools(**bedrock_kwargs))
+        
         try:
             start_time = time.time()
-            response_text, thinking_content, thinking_time = await call_bedrock_converse_with_tools(
-                model_id=bedrock_model_id,
-                messages=messages_for_llm,
-                aws_config=extra_config,
-                max_tokens=4000,
-                extended_thinking=bedrock_extended_thinking,
-                thinking_budget=thinking_budget,
-                enable_web_search=bedrock_web_search,
-                enable_kb_tools=False,  # KB tools use different system for file attachments
-                project_id=conv["project_id"],
-                temperature=project.get("temperature", 0.7),
-                top_p=project.get("top_p", 0.9),
-                chat_images=chat_images if chat_images else None
-            )
+            response_text, thinking_content, thinking_time = await call_bedrock_converse_with_tools(**bedrock_kwargs)
         except Exception as e:
             logger.error(f"Bedrock with files error: {e}")
             raise HTTPException(status_code=500, detail=f"AI chat error: {str(e)}")
@@ -2811,6 +3329,9 @@ async def chat_with_files(
         if use_direct and web_search:
             params["web_search_options"] = {"search_context_size": "medium"}
         
+        if stream:
+            return chat_event_stream(conversation_id, stream_litellm_completion(params))
+        
         try:
             start_time = time.time()
             llm_response = await litellm.acompletion(**params)
@@ -2850,23 +3371,7 @@ async def chat_with_files(
             raise HTTPException(status_code=500, detail=f"AI chat error: {str(e)}")
     
     # Save assistant message
-    asst_msg = {
-        "id": str(uuid.uuid4()),
-        "conversation_id": conversation_id,
-        "role": "assistant",
-        "content": response_text,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    if thinking_content:
-        asst_msg["thinking"] = thinking_content
-        asst_msg["thinking_time"] = thinking_time
-    
-    await db.messages.insert_one(asst_msg)
-    
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    asst_msg = await save_assistant_message(conversation_id, response_text, thinking_content, thinking_time)
     
     result = {"response": response_text, "message_id": asst_msg["id"]}
     if thinking_content:
@@ -2949,8 +3454,16 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+@app.on_event("startup")
+async def ensure_db_indexes():
+    await ensure_indexes(db)
+    await backfill_project_file_counts()
+    # Warm the context tokenizer (may download its BPE file) without delaying startup
+    run_in_background(load_tokenizer())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
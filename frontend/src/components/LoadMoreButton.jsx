@@ -0,0 +1,16 @@
+import { Loader2 } from "lucide-react";
+import { Button } from "@/components/ui/button";
+
+// "Load more" control for cursor-paginated lists; hidden once the list is complete
+export const LoadMoreButton = ({ cursor, loading, onClick, label = "Load more", testId = "load-more-btn" }) => {
+  if (!cursor) return null;
+
+  return (
+    <div className="flex justify-center py-4">
+      <Button variant="outline" size="sm" onClick={onClick} disabled={loading} data-testid={testId}>
+        {loading && <Loader2 className="h-4 w-4 mr-2 animate-spin" />}
+        {label}
+      </Button>
+    </div>
+  );
+};
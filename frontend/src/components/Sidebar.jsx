@@ -40,7 +40,7 @@ export const Sidebar = ({ collapsed, onToggle, currentPath }) => {
       ]);
       setRecentConversations(convos.filter(c => !c.starred));
       setStarredConversations(convos.filter(c => c.starred));
-      setProjects(projs.slice(0, 5));
+      setProjects(projs.items.slice(0, 5));
     } catch (error) {
       console.error("Failed to load sidebar data:", error);
     }
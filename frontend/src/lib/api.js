@@ -11,13 +11,22 @@ const api = axios.create({
   withCredentials: true, // Send cookies for authentication
 });
 
+// List endpoints return one page at a time and put the cursor for the next
+// page in the X-Next-Cursor header. Getters return { items, nextCursor };
+// pass nextCursor back to load the following page.
+const getPage = async (path, params = new URLSearchParams(), cursor = null) => {
+  if (cursor) params.set("cursor", cursor);
+  const query = params.toString();
+  const response = await api.get(query ? `${path}?${query}` : path);
+  return { items: response.data, nextCursor: response.headers["x-next-cursor"] || null };
+};
+
 // Projects
-export const getProjects = async (search = "", starredOnly = false) => {
+export const getProjects = async (search = "", starredOnly = false, cursor = null) => {
   const params = new URLSearchParams();
   if (search) params.append("search", search);
   if (starredOnly) params.append("starred_only", "true");
-  const response = await api.get(`/projects?${params.toString()}`);
-  return response.data;
+  return getPage("/projects", params, cursor);
 };
 
 export const getProject = async (projectId) => {
@@ -46,9 +55,8 @@ export const toggleStarProject = async (projectId) => {
 };
 
 // Files
-export const getProjectFiles = async (projectId) => {
-  const response = await api.get(`/projects/${projectId}/files`);
-  return response.data;
+export const getProjectFiles = async (projectId, cursor = null) => {
+  return getPage(`/projects/${projectId}/files`, undefined, cursor);
 };
 
 export const uploadFile = async (projectId, file) => {
@@ -65,6 +73,13 @@ export const deleteFile = async (fileId) => {
   return response.data;
 };
 
+// Indexing runs after upload/restore/reindex return; index_status is
+// pending -> indexing -> indexed (or failed)
+export const getFileIndexStatus = async (fileId) => {
+  const response = await api.get(`/files/${fileId}/index-status`);
+  return response.data;
+};
+
 export const getFileDownloadUrl = (fileId) => {
   return `${API}/files/${fileId}/download`;
 };
@@ -84,9 +99,8 @@ export const restoreFileVersion = async (fileId, versionId) => {
 };
 
 // Conversations
-export const getProjectConversations = async (projectId) => {
-  const response = await api.get(`/projects/${projectId}/conversations`);
-  return response.data;
+export const getProjectConversations = async (projectId, cursor = null) => {
+  return getPage(`/projects/${projectId}/conversations`, undefined, cursor);
 };
 
 export const getRecentConversations = async (limit = 10) => {
@@ -113,12 +127,11 @@ export const updateConversation = async (conversationId, data) => {
   return response.data;
 };
 
-export const getAllConversations = async (starred = null, archived = null) => {
+export const getAllConversations = async (starred = null, archived = null, cursor = null) => {
   const params = new URLSearchParams();
   if (starred !== null) params.append("starred", starred);
   if (archived !== null) params.append("archived", archived);
-  const response = await api.get(`/conversations?${params.toString()}`);
-  return response.data;
+  return getPage("/conversations", params, cursor);
 };
 
 export const deleteConversation = async (conversationId) => {
@@ -131,10 +144,10 @@ export const toggleStarConversation = async (conversationId) => {
   return response.data;
 };
 
-// Messages
-export const getMessages = async (conversationId) => {
-  const response = await api.get(`/conversations/${conversationId}/messages`);
-  return response.data;
+// Messages: the first page holds the newest messages (oldest first within the
+// page); nextCursor loads the page before it
+export const getMessages = async (conversationId, cursor = null) => {
+  return getPage(`/conversations/${conversationId}/messages`, undefined, cursor);
 };
 
 // Chat
@@ -179,6 +192,93 @@ export const sendMessage = async (conversationId, message, options = {}) => {
   return response.data;
 };
 
+// Streaming chat: the reply arrives as server-sent events (thinking/text deltas,
+// tool progress), then "done" with the saved message id or "error".
+// handlers: { onThinking(delta), onText(delta), onTool(event) }; resolves with the done payload.
+export const streamMessage = async (conversationId, message, options = {}, handlers = {}) => {
+  const {
+    includeKnowledgeBase = true,
+    extendedThinking = false,
+    thinkingBudget = 10000,
+    webSearch = false,
+    files = []
+  } = options;
+
+  let path = "/chat";
+  let request;
+  if (files && files.length > 0) {
+    const formData = new FormData();
+    formData.append("conversation_id", conversationId);
+    formData.append("message", message);
+    formData.append("include_knowledge_base", includeKnowledgeBase);
+    formData.append("extended_thinking", extendedThinking);
+    formData.append("thinking_budget", thinkingBudget);
+    formData.append("web_search", webSearch);
+    formData.append("stream", true);
+    files.forEach((file) => {
+      formData.append("files", file);
+    });
+    path = "/chat/with-files";
+    request = { body: formData };
+  } else {
+    request = {
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        conversation_id: conversationId,
+        message,
+        include_knowledge_base: includeKnowledgeBase,
+        extended_thinking: extendedThinking,
+        thinking_budget: thinkingBudget,
+        web_search: webSearch,
+        stream: true,
+      }),
+    };
+  }
+
+  // axios cannot read a response body incrementally in the browser; use fetch
+  const response = await fetch(`${API}${path}`, { method: "POST", credentials: "include", ...request });
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    const error = new Error(data.detail || "Failed to send message");
+    error.detail = data.detail;
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+      const payload = data ? JSON.parse(data) : {};
+
+      if (event === "thinking") handlers.onThinking?.(payload.delta);
+      else if (event === "text") handlers.onText?.(payload.delta);
+      else if (event === "tool") handlers.onTool?.(payload);
+      else if (event === "done") return payload;
+      else if (event === "error") {
+        const error = new Error(payload.detail);
+        error.detail = payload.detail;
+        throw error;
+      }
+    }
+  }
+  throw new Error("Connection closed before the reply finished");
+};
+
 // Storage
 export const getStorageConfig = async () => {
   const response = await api.get("/storage/config");
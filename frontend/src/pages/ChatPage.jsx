@@ -58,10 +58,11 @@ import { Prism as SyntaxHighlighter } from "react-syntax-highlighter";
 import { oneDark, oneLight } from "react-syntax-highlighter/dist/esm/styles/prism";
 import { useTheme } from "@/components/ThemeProvider";
 import { 
-  getConversation, getMessages, sendMessage, deleteConversation,
+  getConversation, getMessages, streamMessage, deleteConversation,
   toggleStarConversation, getProject, getProjectFiles, getFeatureConfig,
   getProjects, updateConversation, updateProject
 } from "@/lib/api";
+import { LoadMoreButton } from "@/components/LoadMoreButton";
 import { toast } from "sonner";
 
 // Copy button component for messages
@@ -95,6 +96,16 @@ const CopyButton = ({ text }) => {
   );
 };
 
+// Progress label for a tool the model is running while a reply streams
+const TOOL_LABELS = {
+  web_search: (input) => `Searching the web${input?.query ? ` for "${input.query}"` : ""}`,
+  get_kb_file: (input) => `Reading ${input?.filename || "knowledge base file"}`,
+  search_kb: (input) => `Searching knowledge base${input?.search_term ? ` for "${input.search_term}"` : ""}`,
+  crop_image: (input) => `Examining ${input?.image_name || "image"}`,
+};
+
+const toolLabel = (tool) => (TOOL_LABELS[tool.name] || (() => `Running ${tool.name}`))(tool.input);
+
 // Thinking block component - collapsible like Claude.ai
 const ThinkingBlock = ({ thinking, thinkingTime, currentTheme }) => {
   const [isOpen, setIsOpen] = useState(false);
@@ -160,12 +171,16 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
   const textareaRef = useRef(null);
   const scrollContainerRef = useRef(null);
   const fileInputRef = useRef(null);
+  // Set while earlier messages are prepended so the view is not yanked to the bottom
+  const keepScrollRef = useRef(false);
   const { theme } = useTheme();
   
   const [conversation, setConversation] = useState(null);
   const [project, setProject] = useState(null);
   const [files, setFiles] = useState([]);
   const [messages, setMessages] = useState([]);
+  const [messagesCursor, setMessagesCursor] = useState(null);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(true);
   const [sending, setSending] = useState(false);
@@ -231,6 +246,10 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
 
   useEffect(() => {
     // Auto-scroll to bottom when messages load or update
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
@@ -244,25 +263,22 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
     setShowScrollButton(!isAtBottom);
   };
 
-  useEffect(() => {
-    scrollToBottom();
-  }, [messages]);
-
   const loadChatData = async () => {
     try {
-      const [conv, msgs, featureConfig, projList] = await Promise.all([
+      const [conv, msgsPage, featureConfig, projPage] = await Promise.all([
         getConversation(conversationId),
         getMessages(conversationId),
         getFeatureConfig(),
         getProjects()
       ]);
       setConversation(conv);
-      setMessages(msgs);
+      setMessages(msgsPage.items);
+      setMessagesCursor(msgsPage.nextCursor);
       setFeaturesAvailable(featureConfig.extended_thinking_available);
       setBedrockWebSearchAvailable(featureConfig.bedrock_web_search_available || false);
       setAvailableProviders(featureConfig.available_providers || ["bedrock-claude-sonnet"]);
 
-      setAllProjects(projList);
+      setAllProjects(projPage.items);
       
       // Load Think/Web settings from conversation (persisted per conversation)
       // These override project defaults
@@ -293,12 +309,12 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
       
       // Load project and files
       if (conv.project_id) {
-        const [proj, filesList] = await Promise.all([
+        const [proj, filesPage] = await Promise.all([
           getProject(conv.project_id),
           getProjectFiles(conv.project_id)
         ]);
         setProject(proj);
-        setFiles(filesList);
+        setFiles(filesPage.items);
         setInstructionsText(proj.instructions || "");
         setMemoryText(proj.memory || "");
         setTemperature(proj.temperature ?? 0.7);
@@ -331,6 +347,20 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
     }
   };
 
+  const loadEarlierMessages = async () => {
+    setLoadingEarlier(true);
+    try {
+      const page = await getMessages(conversationId, messagesCursor);
+      keepScrollRef.current = true;
+      setMessages(prev => [...page.items, ...prev]);
+      setMessagesCursor(page.nextCursor);
+    } catch (error) {
+      toast.error("Failed to load earlier messages");
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
+
   const handleFileSelect = (e) => {
     const selectedFiles = Array.from(e.target.files);
     const validFiles = selectedFiles.filter(file => {
@@ -421,29 +451,52 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
     };
     setMessages(prev => [...prev, tempUserMsg]);
     
+    // Assistant placeholder, filled in as the reply streams
+    const streamingId = `streaming-${Date.now()}`;
+    setMessages(prev => [...prev, {
+      id: streamingId,
+      role: "assistant",
+      content: "",
+      thinking: null,
+      thinking_time: null,
+      streaming: true,
+      tools: [],
+      created_at: new Date().toISOString()
+    }]);
+    const updateStreaming = (update) => {
+      setMessages(prev => prev.map(m => (m.id === streamingId ? { ...m, ...update(m) } : m)));
+    };
+    
     try {
-      const response = await sendMessage(conversationId, userMessage || "Please analyze the attached file(s).", {
+      const done = await streamMessage(conversationId, userMessage || "Please analyze the attached file(s).", {
         includeKnowledgeBase: includeKB,
         extendedThinking: featuresAvailable && extendedThinking,
         thinkingBudget: project?.thinking_budget || 10000,
         webSearch: featuresAvailable && webSearch,
         files: filesToSend
+      }, {
+        onThinking: (delta) => updateStreaming(m => ({ thinking: (m.thinking || "") + delta })),
+        onText: (delta) => updateStreaming(m => ({ content: m.content + delta })),
+        onTool: (tool) => updateStreaming(m => {
+          // A tool call ends the model's turn; only the final turn's reply is kept
+          if (tool.status === "running") return { content: "", thinking: null, tools: [...m.tools, tool] };
+          // Drop one running entry for the tool that finished
+          const index = m.tools.findIndex(t => t.name === tool.name);
+          return { tools: m.tools.filter((_, i) => i !== index) };
+        })
       });
       
-      // Add assistant message with thinking if present
-      const assistantMsg = {
-        id: response.message_id,
-        role: "assistant",
-        content: response.response,
-        thinking: response.thinking || null,
-        thinking_time: response.thinking_time || null,
-        created_at: new Date().toISOString()
-      };
-      setMessages(prev => [...prev, assistantMsg]);
+      // Reply is saved; swap the placeholder for the stored message id
+      updateStreaming(() => ({
+        id: done.message_id,
+        thinking_time: done.thinking_time || null,
+        streaming: false,
+        tools: []
+      }));
     } catch (error) {
-      toast.error(error.response?.data?.detail || "Failed to send message");
-      // Remove temp message on error
-      setMessages(prev => prev.filter(m => m.id !== tempUserMsg.id));
+      toast.error(error.detail || "Failed to send message");
+      // Remove temp messages on error
+      setMessages(prev => prev.filter(m => m.id !== tempUserMsg.id && m.id !== streamingId));
       setInput(userMessage);
       setAttachedFiles(filesToSend);
     } finally {
@@ -697,6 +750,13 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
                 </div>
               ) : (
                 <>
+                  <LoadMoreButton
+                    cursor={messagesCursor}
+                    loading={loadingEarlier}
+                    onClick={loadEarlierMessages}
+                    label="Load earlier messages"
+                    testId="load-earlier-messages-btn"
+                  />
                   {messages.map((msg) => {
                 // Parse attachments from user messages
                 let messageText = msg.content;
@@ -794,6 +854,16 @@ export default function ChatPage({ onRightPanelOpen, onRightPanelClose, sidebarC
                         >
                           {msg.content}
                         </ReactMarkdown>
+                        {msg.streaming && (
+                          <div className="flex items-center gap-2 text-sm text-muted-foreground mt-1" data-testid="streaming-status">
+                            <Loader2 className="h-3.5 w-3.5 animate-spin" />
+                            <span>
+                              {msg.tools?.length
+                                ? msg.tools.map(toolLabel).join(" • ")
+                                : (msg.content ? "" : (msg.thinking ? "Thinking..." : "Waiting for response..."))}
+                            </span>
+                          </div>
+                        )}
                       </div>
                     ) : (
                       <div className="prose-content text-foreground">
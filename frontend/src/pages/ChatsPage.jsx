@@ -27,12 +27,15 @@ import {
 } from "@/components/ui/select";
 import { getAllConversations, deleteConversation, toggleStarConversation, updateConversation, getProjects } from "@/lib/api";
 import { toast } from "sonner";
+import { LoadMoreButton } from "@/components/LoadMoreButton";
 
 export default function ChatsPage() {
   const navigate = useNavigate();
   const [chats, setChats] = useState([]);
   const [projects, setProjects] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [editingChat, setEditingChat] = useState(null);
   const [editForm, setEditForm] = useState({ name: "", project_id: "" });
 
@@ -42,12 +45,13 @@ export default function ChatsPage() {
 
   const loadData = async () => {
     try {
-      const [chatsData, projectsData] = await Promise.all([
+      const [chatsPage, projectsPage] = await Promise.all([
         getAllConversations(),
         getProjects()
       ]);
-      setChats(chatsData);
-      setProjects(projectsData);
+      setChats(chatsPage.items);
+      setNextCursor(chatsPage.nextCursor);
+      setProjects(projectsPage.items);
     } catch (error) {
       toast.error("Failed to load chats");
     } finally {
@@ -55,6 +59,19 @@ export default function ChatsPage() {
     }
   };
 
+  const loadMoreChats = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getAllConversations(null, null, nextCursor);
+      setChats(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      toast.error("Failed to load chats");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleToggleStar = async (chatId, e) => {
     e.stopPropagation();
     try {
@@ -273,6 +290,13 @@ export default function ChatsPage() {
               </div>
             </div>
           )}
+
+          <LoadMoreButton
+            cursor={nextCursor}
+            loading={loadingMore}
+            onClick={loadMoreChats}
+            testId="load-more-chats-btn"
+          />
         </ScrollArea>
       )}
 
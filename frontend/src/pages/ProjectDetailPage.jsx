@@ -20,11 +20,12 @@ import {
 import { Label } from "@/components/ui/label";
 import { Progress } from "@/components/ui/progress";
 import { 
-  getProject, updateProject, getProjectFiles, uploadFile, deleteFile,
+  getProject, updateProject, getProjectFiles, uploadFile, deleteFile, getFileIndexStatus,
   getProjectConversations, createConversation, getFileDownloadUrl,
   getFileVersions, restoreFileVersion
 } from "@/lib/api";
 import { toast } from "sonner";
+import { LoadMoreButton } from "@/components/LoadMoreButton";
 import ReactMarkdown from "react-markdown";
 import remarkGfm from "remark-gfm";
 
@@ -48,6 +49,15 @@ const formatFileSize = (bytes) => {
   return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
 };
 
+const INDEXING_STATUSES = ["pending", "indexing"];
+
+const indexBadge = (file) => {
+  if (file.index_status === "failed") return { label: "Failed", className: "bg-red-500/20 text-red-500" };
+  if (file.index_status === "indexing") return { label: "Indexing", className: "bg-yellow-500/20 text-yellow-500" };
+  if (file.index_status !== "pending" && file.indexed) return { label: "Indexed", className: "bg-green-500/20 text-green-500" };
+  return { label: "Pending", className: "bg-yellow-500/20 text-yellow-500" };
+};
+
 export default function ProjectDetailPage() {
   const { projectId } = useParams();
   const navigate = useNavigate();
@@ -56,6 +66,9 @@ export default function ProjectDetailPage() {
   const [project, setProject] = useState(null);
   const [files, setFiles] = useState([]);
   const [conversations, setConversations] = useState([]);
+  const [filesCursor, setFilesCursor] = useState(null);
+  const [conversationsCursor, setConversationsCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [uploading, setUploading] = useState(false);
   const [activeTab, setActiveTab] = useState("files");
@@ -96,16 +109,34 @@ export default function ProjectDetailPage() {
     loadProjectData();
   }, [projectId]);
 
+  // Poll files that are still waiting to be indexed
+  useEffect(() => {
+    const waiting = files.filter(f => INDEXING_STATUSES.includes(f.index_status));
+    if (waiting.length === 0) return;
+    const timer = setTimeout(async () => {
+      try {
+        const statuses = await Promise.all(waiting.map(f => getFileIndexStatus(f.id)));
+        const byId = Object.fromEntries(statuses.map(status => [status.id, status]));
+        setFiles(prev => prev.map(f => (byId[f.id] ? { ...f, ...byId[f.id] } : f)));
+      } catch (error) {
+        console.error("Failed to refresh index status:", error);
+      }
+    }, 3000);
+    return () => clearTimeout(timer);
+  }, [files]);
+
   const loadProjectData = async () => {
     try {
-      const [proj, filesList, convs] = await Promise.all([
+      const [proj, filesPage, convsPage] = await Promise.all([
         getProject(projectId),
         getProjectFiles(projectId),
         getProjectConversations(projectId)
       ]);
       setProject(proj);
-      setFiles(filesList);
-      setConversations(convs);
+      setFiles(filesPage.items);
+      setFilesCursor(filesPage.nextCursor);
+      setConversations(convsPage.items);
+      setConversationsCursor(convsPage.nextCursor);
       setInstructionsText(proj.instructions || "");
       setMemoryText(proj.memory || "");
       // Load LLM parameters
@@ -124,6 +155,32 @@ export default function ProjectDetailPage() {
     }
   };
 
+  const loadMoreFiles = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getProjectFiles(projectId, filesCursor);
+      setFiles(prev => [...prev, ...page.items]);
+      setFilesCursor(page.nextCursor);
+    } catch (error) {
+      toast.error("Failed to load files");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const loadMoreConversations = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getProjectConversations(projectId, conversationsCursor);
+      setConversations(prev => [...prev, ...page.items]);
+      setConversationsCursor(page.nextCursor);
+    } catch (error) {
+      toast.error("Failed to load conversations");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const saveLlmParams = async () => {
     try {
       await updateProject(projectId, {
@@ -192,6 +249,7 @@ export default function ProjectDetailPage() {
     try {
       await deleteFile(fileId);
       setFiles(files.filter(f => f.id !== fileId));
+      setProject(prev => ({ ...prev, file_count: Math.max((prev.file_count ?? 1) - 1, 0) }));
       toast.success("File deleted");
     } catch (error) {
       toast.error("Failed to delete file");
@@ -376,7 +434,7 @@ export default function ProjectDetailPage() {
             {/* Capacity Bar */}
             <div className="mb-6">
               <div className="flex justify-between text-sm mb-2">
-                <span className="text-muted-foreground">{files.length} files</span>
+                <span className="text-muted-foreground">{project.file_count ?? files.length} files</span>
                 <span className="text-muted-foreground">{calculateCapacity().toFixed(0)}% capacity used</span>
               </div>
               <Progress value={calculateCapacity()} className="h-1" />
@@ -406,8 +464,8 @@ export default function ProjectDetailPage() {
                       </div>
                     </div>
                     <div className="flex items-center gap-1 mt-2 opacity-0 group-hover:opacity-100 transition-opacity">
-                      <span className={`text-xs px-1.5 py-0.5 rounded ${file.indexed ? 'bg-green-500/20 text-green-500' : 'bg-yellow-500/20 text-yellow-500'}`}>
-                        {file.indexed ? 'Indexed' : 'Pending'}
+                      <span className={`text-xs px-1.5 py-0.5 rounded ${indexBadge(file).className}`}>
+                        {indexBadge(file).label}
                       </span>
                       <div className="flex-1" />
                       <Button
@@ -445,6 +503,13 @@ export default function ProjectDetailPage() {
                 ))}
               </div>
             )}
+            <LoadMoreButton
+              cursor={filesCursor}
+              loading={loadingMore}
+              onClick={loadMoreFiles}
+              label="Load more files"
+              testId="load-more-files-btn"
+            />
           </TabsContent>
 
           <TabsContent value="conversations" className="flex-1 overflow-auto px-6 py-4">
@@ -481,6 +546,13 @@ export default function ProjectDetailPage() {
                 ))}
               </div>
             )}
+            <LoadMoreButton
+              cursor={conversationsCursor}
+              loading={loadingMore}
+              onClick={loadMoreConversations}
+              label="Load more conversations"
+              testId="load-more-conversations-btn"
+            />
           </TabsContent>
         </Tabs>
       </div>
@@ -587,7 +659,7 @@ export default function ProjectDetailPage() {
           <div>
             <h3 className="text-sm font-medium mb-2">Files</h3>
             <p className="text-xs text-muted-foreground mb-2">
-              {files.length} files in knowledge base
+              {project.file_count ?? files.length} files in knowledge base
             </p>
             <div className="capacity-bar">
               <div 
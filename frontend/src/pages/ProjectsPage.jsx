@@ -20,12 +20,15 @@ import { Label } from "@/components/ui/label";
 import { Textarea } from "@/components/ui/textarea";
 import { getProjects, createProject, deleteProject, toggleStarProject, updateProject } from "@/lib/api";
 import { toast } from "sonner";
+import { LoadMoreButton } from "@/components/LoadMoreButton";
 
 export default function ProjectsPage() {
   const navigate = useNavigate();
   const [projects, setProjects] = useState([]);
   const [search, setSearch] = useState("");
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showNewProject, setShowNewProject] = useState(false);
   const [newProject, setNewProject] = useState({ name: "", description: "" });
   const [editingProject, setEditingProject] = useState(null);
@@ -37,8 +40,9 @@ export default function ProjectsPage() {
 
   const loadProjects = async () => {
     try {
-      const data = await getProjects(search);
-      setProjects(data);
+      const page = await getProjects(search);
+      setProjects(page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       toast.error("Failed to load projects");
     } finally {
@@ -46,6 +50,19 @@ export default function ProjectsPage() {
     }
   };
 
+  const loadMoreProjects = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getProjects(search, false, nextCursor);
+      setProjects(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      toast.error("Failed to load projects");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleCreateProject = async () => {
     if (!newProject.name.trim()) {
       toast.error("Project name is required");
@@ -235,6 +252,15 @@ export default function ProjectsPage() {
         </div>
       )}
 
+      {!loading && (
+        <LoadMoreButton
+          cursor={nextCursor}
+          loading={loadingMore}
+          onClick={loadMoreProjects}
+          testId="load-more-projects-btn"
+        />
+      )}
+
       {/* New Project Dialog */}
       <Dialog open={showNewProject} onOpenChange={setShowNewProject}>
         <DialogContent data-testid="new-project-dialog" aria-describedby="new-project-description">